@@ -0,0 +1,143 @@
+"""
+数据库变慢时 /health 的响应延迟
+
+用SQLite模拟慢数据库：每条SQL执行前在驱动线程中睡眠 --db-delay 秒。
+sync  模式按旧实现在协程里直接用同步会话读取实例清单，阻塞事件循环；
+async 模式使用异步会话同步实例清单索引，等待数据库期间事件循环继续处理请求。
+
+用法:
+    python benchmarks/health_latency.py [--db-delay 0.2] [--duration 5] [--rows 2000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_file}'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.util import await_only  # noqa: E402
+
+from core.app import app  # noqa: E402
+from models.database import SessionLocal, async_engine, engine  # noqa: E402
+from models.instance import AliyunAccount, InstanceList, InstanceNodeId, InstanceUsers  # noqa: E402
+from services.inventory import get_inventory  # noqa: E402
+
+
+def seed(rows: int):
+    """写入测试数据"""
+    db = SessionLocal()
+    try:
+        db.add(AliyunAccount(
+            aliyun_uid='bench', aliyun_name='bench', access_key_id='ak',
+            encrypted_access_key_secret='secret', region_id='cn-shanghai', status=1
+        ))
+        for i in range(rows):
+            db.add(InstanceList(
+                ins_id=f'rm-{i}', ins_name=f'rm-{i}', ins_is_readonly=0, ins_type='RDS',
+                ins_status=1, engine='mysql', engine_version='8.0', aliyun_uid='bench'
+            ))
+            db.add(InstanceNodeId(ins_id=f'rm-{i}', node_id=f'n-{i}', node_type=0))
+            db.add(InstanceUsers(ins_id=f'rm-{i}', username='app', max_user_connections=100))
+        db.commit()
+    finally:
+        db.close()
+
+
+def install_delay(delay: float):
+    """每条SQL执行前在驱动所在线程睡眠，模拟网络和数据库延迟"""
+    def trace(_statement):
+        time.sleep(delay)
+
+    @event.listens_for(engine, 'connect')
+    def on_sync_connect(dbapi_connection, _record):
+        dbapi_connection.set_trace_callback(trace)
+
+    @event.listens_for(async_engine.sync_engine, 'connect')
+    def on_async_connect(dbapi_connection, _record):
+        # aiosqlite 在自己的线程中执行SQL，回调也在该线程中运行
+        await_only(dbapi_connection.driver_connection.set_trace_callback(trace))
+
+
+async def sync_inventory_read():
+    """旧实现：协程中直接执行同步查询"""
+    db = SessionLocal()
+    try:
+        for model in (InstanceList, InstanceNodeId, AliyunAccount, InstanceUsers):
+            db.query(model).all()
+    finally:
+        db.close()
+
+
+async def async_inventory_read():
+    """新实现：异步会话全量同步实例清单索引"""
+    inventory = get_inventory()
+    inventory.invalidate()
+    await inventory.refresh()
+
+
+async def run(mode: str, duration: float, interval: float) -> list:
+    """在持续读取实例清单的同时按固定间隔请求 /health，返回每个计划请求的延迟"""
+    reader = sync_inventory_read if mode == 'sync' else async_inventory_read
+    latencies = []
+    stop_at = time.perf_counter() + duration
+
+    async def db_loop():
+        while time.perf_counter() < stop_at:
+            await reader()
+            await asyncio.sleep(0)
+
+    async def health_loop(client: httpx.AsyncClient):
+        # 延迟从计划发送时间算起，事件循环被阻塞期间本应发出的请求也计入等待时间
+        scheduled = time.perf_counter()
+        while scheduled < stop_at:
+            response = await client.get('/health')
+            assert response.status_code == 200
+            now = time.perf_counter()
+            while scheduled <= now:
+                latencies.append(now - scheduled)
+                scheduled += interval
+            await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        await asyncio.gather(db_loop(), health_loop(client))
+    return latencies
+
+
+def report(mode: str, latencies: list):
+    latencies = sorted(latencies)
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    print(
+        f"{mode:<6} requests={len(latencies):<6} "
+        f"p50={statistics.median(latencies) * 1000:8.2f}ms "
+        f"p99={p99 * 1000:8.2f}ms max={latencies[-1] * 1000:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db-delay', type=float, default=0.2, help='每条SQL的模拟延迟（秒）')
+    parser.add_argument('--duration', type=float, default=5.0, help='每种模式的运行时间（秒）')
+    parser.add_argument('--interval', type=float, default=0.01, help='/health 请求间隔（秒）')
+    parser.add_argument('--rows', type=int, default=2000, help='实例数')
+    args = parser.parse_args()
+
+    seed(args.rows)
+    install_delay(args.db_delay)
+    print(f"SQLite {args.rows} 个实例, 每条SQL延迟 {args.db_delay * 1000:.0f}ms, 每种模式运行 {args.duration:.0f} 秒")
+
+    for mode in ('sync', 'async'):
+        report(mode, asyncio.run(run(mode, args.duration, args.interval)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+会话变动统计的内存和CPU开销
+
+模拟 --targets 个采集目标、每个目标 --sessions 个会话分布在 --users 个用户上，
+每轮有 --churn 比例的会话关闭并新建同样数量的会话，连续统计 --cycles 轮。
+对比两种线程ID存储方式：
+numpy  每个目标一个有序 numpy int64 数组，一次 searchsorted 求交集（ChurnTracker 的实现）
+set    Python set（对照组，每个线程ID都是一个Python int 对象）
+
+用法:
+    python benchmarks/session_churn.py [--targets 300] [--sessions 2000] [--users 20] [--churn 0.1] [--cycles 5]
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config.settings import settings  # noqa: E402
+from services.session_churn import ChurnTracker  # noqa: E402
+
+
+class SetTracker:
+    """对照组：用Python set保存线程ID"""
+
+    def __init__(self):
+        self.targets = {}
+
+    def observe(self, key, users):
+        previous = self.targets.get(key, {})
+        current = {}
+        for label_values, thread_ids in users:
+            ids = set(thread_ids)
+            before = previous.get(label_values, set())
+            len(ids - before), len(before - ids)
+            current[label_values] = ids
+        self.targets[key] = current
+
+    def thread_count(self):
+        return sum(len(ids) for users in self.targets.values() for ids in users.values())
+
+
+def generate_cycles(args):
+    """生成每轮每个目标的各用户线程ID"""
+    rng = random.Random(0)
+    next_id = 1
+    states = []
+    for _ in range(args.targets):
+        ids = list(range(next_id, next_id + args.sessions))
+        next_id += args.sessions
+        states.append(ids)
+
+    cycles = []
+    for _ in range(args.cycles):
+        cycle = []
+        for index, ids in enumerate(states):
+            closing = set(rng.sample(range(len(ids)), int(len(ids) * args.churn)))
+            ids = [thread_id for position, thread_id in enumerate(ids) if position not in closing]
+            ids.extend(range(next_id, next_id + len(closing)))
+            next_id += len(closing)
+            states[index] = ids
+            users = {}
+            for thread_id in ids:
+                users.setdefault((f"t{index}", f"user_{thread_id % args.users}"), []).append(thread_id)
+            cycle.append(((f"t{index}", ''), list(users.items())))
+        cycles.append(cycle)
+    return cycles
+
+
+def run_cycles(tracker, cycles):
+    """逐轮统计，返回每轮耗时"""
+    timings = []
+    for cycle in cycles:
+        start = time.perf_counter()
+        for key, users in cycle:
+            tracker.observe(key, users)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def measure(name: str, tracker_factory, cycles) -> dict:
+    """
+    统计每轮耗时（首轮只建立基线，不计入），
+    另用一个跟踪器在tracemalloc下统计最后一轮后的常驻内存（tracemalloc会拖慢分配，不与计时同时进行）
+    """
+    timings = run_cycles(tracker_factory(), cycles)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracker = tracker_factory()
+    run_cycles(tracker, cycles)
+    gc.collect()
+    resident = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        'name': name,
+        'cycle_ms': statistics.median(timings[1:] or timings) * 1000,
+        'resident_mb': resident / 1024 / 1024,
+        'thread_ids': tracker.thread_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', type=int, default=300, help='采集目标数')
+    parser.add_argument('--sessions', type=int, default=2000, help='每个目标的会话数')
+    parser.add_argument('--users', type=int, default=20, help='每个目标的用户数')
+    parser.add_argument('--churn', type=float, default=0.1, help='每轮关闭并新建的会话比例')
+    parser.add_argument('--cycles', type=int, default=5, help='统计轮数')
+    args = parser.parse_args()
+    settings.SESSION_CHURN_MAX_THREADS = max(settings.SESSION_CHURN_MAX_THREADS, args.sessions)
+
+    cycles = generate_cycles(args)
+    print(f"{args.targets} 个目标，每个目标 {args.sessions} 个会话，每轮变动 {args.churn:.0%}")
+
+    results = [
+        measure('numpy', ChurnTracker, cycles),
+        measure('set', SetTracker, cycles),
+    ]
+
+    print(f"{'storage':<8}{'cycle(ms)':>11}{'resident(MB)':>14}{'thread_ids':>12}{'bytes/id':>10}")
+    for r in results:
+        print(f"{r['name']:<8}{r['cycle_ms']:>11.1f}{r['resident_mb']:>14.1f}{r['thread_ids']:>12}"
+              f"{r['resident_mb'] * 1024 * 1024 / max(r['thread_ids'], 1):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
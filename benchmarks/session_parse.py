@@ -0,0 +1,157 @@
+"""
+GetMySQLAllSessionAsync 响应解析的CPU和内存开销
+
+生成包含 --sessions 个会话的模拟响应体（SessionList 和 UserStats/ClientStats 的 ThreadIdList 与会话数等量），
+对比两种解析方式：
+sdk  JSON解码后由 TeaCore.from_map 转换为SDK模型（DAS_RESPONSE_PARSER=sdk）
+fast 剔除 SessionList/ThreadIdList 后解码，只构建导出用到的字段（DAS_RESPONSE_PARSER=fast）
+
+用法:
+    python benchmarks/session_parse.py [--sessions 20000] [--users 200] [--clients 500] [--rounds 10]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alibabacloud_das20200116 import models as das20200116_models  # noqa: E402
+from Tea.core import TeaCore  # noqa: E402
+
+from services.session_parser import parse_session_response  # noqa: E402
+
+
+def build_payload(sessions: int, users: int, clients: int) -> str:
+    """生成模拟响应体"""
+    rng = random.Random(0)
+    user_threads = {f"user_{i}": [] for i in range(users)}
+    client_threads = {f"10.0.{i // 256}.{i % 256}": [] for i in range(clients)}
+    session_list = []
+    for thread_id in range(1, sessions + 1):
+        user = f"user_{rng.randrange(users)}"
+        client = f"10.0.{(c := rng.randrange(clients)) // 256}.{c % 256}"
+        user_threads[user].append(thread_id)
+        client_threads[client].append(thread_id)
+        active = rng.random() < 0.1
+        session_list.append({
+            'SessionId': thread_id,
+            'User': user,
+            'Client': f"{client}:{rng.randrange(1024, 65535)}",
+            'DbName': 'app_db',
+            'Command': 'Query' if active else 'Sleep',
+            'Time': rng.randrange(0, 3600),
+            'State': 'executing' if active else '',
+            'SqlText': 'SELECT id, name FROM t_order WHERE user_id = ? AND status IN ("a", "b")' if active else None,
+            'SqlTemplateId': 'a1b2c3' if active else None,
+            'TrxId': '',
+            'TrxDuration': 0,
+            'UserClientAlias': f"{user}@{client}",
+        })
+
+    def stats(threads):
+        return [
+            {
+                'Key': key,
+                'UserList': [key] if key.startswith('user_') else [],
+                'ThreadIdList': ids,
+                'TotalCount': len(ids),
+                'ActiveCount': len(ids) // 10,
+            }
+            for key, ids in threads.items() if ids
+        ]
+
+    body = {
+        'Code': '200',
+        'Message': 'Successful',
+        'RequestId': 'bench',
+        'Success': True,
+        'Data': {
+            'Complete': True,
+            'Fail': False,
+            'IsFinish': True,
+            'ResultId': 'bench',
+            'State': 'SUCCESS',
+            'Timestamp': int(time.time() * 1000),
+            'SessionData': {
+                'ActiveSessionCount': sessions // 10,
+                'TotalSessionCount': sessions,
+                'MaxActiveTime': 3600,
+                'TimeStamp': int(time.time() * 1000),
+                'SessionList': session_list,
+                'UserStats': stats(user_threads),
+                'ClientStats': stats(client_threads),
+                'DbStats': [{'Key': 'app_db', 'ThreadIdList': list(range(1, sessions + 1)),
+                             'TotalCount': sessions, 'ActiveCount': sessions // 10}],
+            },
+        },
+    }
+    return json.dumps(body)
+
+
+def parse_sdk(raw: str):
+    """SDK模型解析（SDK读取响应体时同样先做JSON解码）"""
+    response = TeaCore.from_map(
+        das20200116_models.GetMySQLAllSessionAsyncResponse(),
+        {'headers': {}, 'statusCode': 200, 'body': json.loads(raw)}
+    )
+    return response.body
+
+
+def user_counts(body) -> dict:
+    """导出指标用到的字段，用于校验两种解析结果一致"""
+    return {
+        tuple(stat.user_list): (stat.total_count, stat.active_count)
+        for stat in body.data.session_data.user_stats
+    }
+
+
+def measure(name: str, func, raw: str, rounds: int) -> dict:
+    """多次解析取耗时中位数，另外单独解析一次统计内存峰值"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(raw)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'name': name,
+        'p50_ms': statistics.median(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'peak_mb': peak / 1024 / 1024,
+        'result': result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=20000, help='会话数')
+    parser.add_argument('--users', type=int, default=200, help='数据库用户数')
+    parser.add_argument('--clients', type=int, default=500, help='客户端IP数')
+    parser.add_argument('--rounds', type=int, default=10, help='每种方式的解析次数')
+    args = parser.parse_args()
+
+    raw = build_payload(args.sessions, args.users, args.clients)
+    print(f"响应体 {len(raw) / 1024 / 1024:.1f} MB，{args.sessions} 个会话")
+
+    results = [measure('sdk', parse_sdk, raw, args.rounds), measure('fast', parse_session_response, raw, args.rounds)]
+    if user_counts(results[0]['result']) != user_counts(results[1]['result']):
+        raise SystemExit("两种解析方式的结果不一致")
+
+    print(f"{'parser':<8}{'p50(ms)':>10}{'min(ms)':>10}{'peak(MB)':>10}")
+    for r in results:
+        print(f"{r['name']:<8}{r['p50_ms']:>10.1f}{r['min_ms']:>10.1f}{r['peak_mb']:>10.1f}")
+    sdk, fast = results
+    print(f"耗时降低 {(1 - fast['p50_ms'] / sdk['p50_ms']) * 100:.0f}%，内存峰值降低 {(1 - fast['peak_mb'] / sdk['peak_mb']) * 100:.0f}%")
+
+
+if __name__ == '__main__':
+    main()
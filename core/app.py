@@ -1,24 +1,24 @@
 """FastAPI应用主文件"""
 import logging
 import time
-import asyncio
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Request
 from fastapi.responses import Response
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
 from contextlib import asynccontextmanager
 
-from models.database import SessionLocal, engine
+from models.database import SessionLocal, async_engine, engine
 from models.instance import Base
-from services.metrics_collector import get_metrics_collector
+from services.collection_scheduler import get_collection_scheduler
+from services.exposition_cache import accepts_gzip, etag_matches, get_exposition_cache
+from services.metrics_collector import get_metrics_collector, peek_metrics_collector
+from services.sharding import get_shard_selector
+from services.session_snapshot import SnapshotCollector, get_snapshot
 from config.settings import settings
 
 
 logger = logging.getLogger(__name__)
 
-# 状态管理
-_last_collection_time: float = 0
-_collection_lock = asyncio.Lock()
-
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
@@ -38,6 +38,7 @@ async def lifespan(app: FastAPI):
     logger.info("应用启动，初始化指标收集器")
     yield
     logger.info("应用正在关闭")
+    await async_engine.dispose()
 
 
 app = FastAPI(
@@ -56,8 +57,10 @@ async def root():
         "version": "2.0.0",
         "endpoints": {
             "/metrics": "Prometheus metrics endpoint",
+            "/probe": "Single instance probe endpoint (?target=<ins_id>&node_id=<node_id>)",
+            "/shard": "Instances owned by this replica",
             "/health": "Health check endpoint",
-            "/refresh": "Manual refresh endpoint (POST)"
+            "/refresh": "Manual refresh endpoint (POST, ?ins_id=<ins_id> to refresh one instance)"
         }
     }
 
@@ -68,46 +71,99 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/shard")
+async def shard():
+    """本副本的分片配置和负责的实例"""
+    selector = get_shard_selector()
+    return {
+        "mode": settings.SHARD_MODE,
+        "shard_index": selector.shard_index(),
+        "shard_count": settings.SHARD_COUNT,
+        "errors": selector.check(),
+        "owned_instances": sorted(selector.owned_instances)
+    }
+
+
 @app.get("/metrics")
-async def get_metrics():
-    """获取Prometheus指标"""
-    global _last_collection_time
+async def get_metrics(request: Request):
+    """
+    获取Prometheus指标
+    始终立即返回最近一次完成的快照，快照过期时在后台触发一次刷新；
+    输出按快照预渲染，支持gzip和ETag/If-None-Match
+    """
+    collector = peek_metrics_collector()
+    last_collection_time = collector.last_collection_time if collector else 0
+    snapshot_time = get_snapshot().session_timestamp
     
     current_time = time.time()
-    should_update = current_time - _last_collection_time >= settings.METRICS_UPDATE_INTERVAL
+    # 持续调度时各目标由调度器按自己的间隔刷新，不再整轮触发
+    if (not get_collection_scheduler().continuous
+            and current_time - last_collection_time >= settings.METRICS_UPDATE_INTERVAL):
+        # 与定时任务和 /refresh 共用同一轮采集
+        get_metrics_collector().trigger_collection()
+    
+    exposition = await get_exposition_cache().get()
+    
+    # 尚无快照时返回-1
+    snapshot_age = current_time - snapshot_time if snapshot_time else -1
+    headers = {
+        "X-Snapshot-Age": f"{snapshot_age:.3f}",
+        "ETag": exposition.etag,
+        "Vary": "Accept-Encoding"
+    }
+    
+    if etag_matches(request.headers.get("if-none-match", ""), exposition.etag):
+        return Response(status_code=304, headers=headers)
+    
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        content = exposition.gzip
+    else:
+        content = exposition.identity
+    
+    return Response(
+        content=content,
+        media_type=CONTENT_TYPE_LATEST,
+        headers=headers
+    )
+
+
+@app.get("/probe")
+async def probe(target: str, node_id: Optional[str] = None):
+    """
+    探测单个实例，供Prometheus通过服务发现和relabel分散抓取
+    与全局采集共享限流器和快照中的目标结果缓存
+    """
+    collector = get_metrics_collector()
+    snapshot = await collector.probe(target, node_id)
     
-    if should_update:
-        async with _collection_lock:
-            # 双重检查
-            if current_time - _last_collection_time >= settings.METRICS_UPDATE_INTERVAL:
-                try:
-                    db = SessionLocal()
-                    try:
-                        collector = get_metrics_collector(db)
-                        await collector.collect_all_metrics()
-                        _last_collection_time = time.time()
-                    finally:
-                        db.close()
-                except Exception as e:
-                    logger.error(f"更新指标失败: {e}")
+    if snapshot is None:
+        return Response(content=f"unknown target: {target}\n", status_code=404)
     
+    registry = CollectorRegistry()
+    registry.register(SnapshotCollector(lambda: snapshot))
     return Response(
-        content=generate_latest(),
+        content=generate_latest(registry),
         media_type=CONTENT_TYPE_LATEST
     )
 
 
 @app.post("/refresh")
-async def refresh_metrics():
-    """手动刷新指标"""
+async def refresh_metrics(ins_id: Optional[str] = None):
+    """
+    手动刷新指标
+    指定 ins_id 时只重新采集该实例并合并到当前快照，否则刷新全部指标；
+    并发的刷新请求加入进行中的同一轮采集
+    """
     try:
-        db = SessionLocal()
-        try:
-            collector = get_metrics_collector(db)
-            await collector.manual_refresh()
-            return {"status": "success", "message": "指标已刷新"}
-        finally:
-            db.close()
+        collector = get_metrics_collector()
+        if ins_id:
+            refreshed = await collector.refresh_instance(ins_id)
+            if refreshed is None:
+                return {"status": "error", "message": f"未找到启用的实例: {ins_id}"}
+            return {"status": "success", "message": f"实例 {ins_id} 已刷新", "targets": refreshed}
+        await collector.manual_refresh()
+        return {"status": "success", "message": "指标已刷新"}
     except Exception as e:
         logger.error(f"刷新指标失败: {e}")
         return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -9,8 +9,10 @@ import uvicorn
 from prometheus_client import REGISTRY, GC_COLLECTOR, PLATFORM_COLLECTOR, PROCESS_COLLECTOR
 
 from config.settings import settings
-from models.database import SessionLocal
-from services.metrics_collector import get_metrics_collector
+from models.database import async_engine
+from services.aliyun_client_manager import get_client_manager
+from services.collection_scheduler import get_collection_scheduler
+from services.sharding import get_shard_selector
 
 
 # 配置日志
@@ -29,65 +31,25 @@ for collector in [GC_COLLECTOR, PLATFORM_COLLECTOR, PROCESS_COLLECTOR]:
         pass
 
 
-class MetricsScheduler:
-    """指标采集调度器"""
-    
-    def __init__(self):
-        self._running = False
-        self._task = None
-    
-    async def _collect_loop(self):
-        """定时采集循环"""
-        while self._running:
-            try:
-                await asyncio.sleep(settings.METRICS_UPDATE_INTERVAL)
-                
-                if not self._running:
-                    break
-                    
-                db = SessionLocal()
-                try:
-                    collector = get_metrics_collector(db)
-                    await collector.collect_all_metrics()
-                    logger.info("定时指标采集完成")
-                except Exception as e:
-                    logger.error(f"定时指标采集失败: {e}")
-                finally:
-                    db.close()
-                    
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"采集循环异常: {e}")
-    
-    def start(self):
-        """启动调度器"""
-        self._running = True
-        self._task = asyncio.create_task(self._collect_loop())
-        logger.info("指标采集调度器已启动")
-    
-    async def stop(self):
-        """停止调度器"""
-        self._running = False
-        if self._task:
-            self._task.cancel()
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
-        logger.info("指标采集调度器已停止")
-
-
 # 全局调度器实例
-scheduler = MetricsScheduler()
+scheduler = get_collection_scheduler()
 
 
 @asynccontextmanager
 async def lifespan_wrapper(app):
     """应用生命周期管理"""
+    # SIGHUP 清空DAS客户端缓存，轮换AK后无需重启进程
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, get_client_manager().invalidate)
+    except (AttributeError, NotImplementedError, RuntimeError) as e:
+        # Windows没有SIGHUP，非主线程中的事件循环也不能注册信号
+        logger.warning(f"无法注册SIGHUP处理: {e}")
+    # 分片配置错误时本副本不负责任何实例，启动时即记录
+    get_shard_selector().check()
     scheduler.start()
     yield
     await scheduler.stop()
+    await async_engine.dispose()
 
 
 def main():
@@ -1,12 +1,14 @@
 """
 数据库模型模块
 """
-from .database import engine, SessionLocal
+from .database import engine, SessionLocal, async_engine, AsyncSessionLocal
 from .instance import InstanceList, InstanceNodeId, InstanceConn, InstanceUsers
 
 __all__ = [
     "engine",
     "SessionLocal",
+    "async_engine",
+    "AsyncSessionLocal",
     "InstanceList",
     "InstanceNodeId", 
     "InstanceConn",
@@ -1,10 +1,48 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config.settings import settings
 
 
-# 创建数据库引擎
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "aiomysql",
+    "mysql+pymysql": "aiomysql",
+    "mysql+mysqldb": "aiomysql",
+    "sqlite": "aiosqlite",
+    "sqlite+pysqlite": "aiosqlite",
+}
+
+
+def get_async_database_url() -> str:
+    """获取异步引擎连接串，未单独配置时由 DATABASE_URL 推导"""
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+    url = make_url(settings.DATABASE_URL)
+    async_driver = ASYNC_DRIVERS.get(url.drivername)
+    if async_driver:
+        url = url.set(drivername=f"{url.get_backend_name()}+{async_driver}")
+    return url.render_as_string(hide_password=False)
+
+
+def _async_engine_options(url: str) -> dict:
+    """异步引擎连接池配置，SQLite不使用连接池大小相关参数"""
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+# 创建数据库引擎（同步，仅用于建表和运维脚本）
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
@@ -13,5 +51,12 @@ engine = create_engine(
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎，服务运行期间的所有实例清单读取都走异步连接池，不阻塞事件循环
+_async_database_url = get_async_database_url()
+async_engine = create_async_engine(_async_database_url, **_async_engine_options(_async_database_url))
+
+# 异步会话工厂，清单对象在会话关闭后继续被内存索引使用，提交时不过期
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 声明基类
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
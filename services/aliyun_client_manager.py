@@ -1,68 +1,139 @@
 """
 阿里云客户端管理器
 管理阿里云客户端的认证和缓存
+客户端按账号在进程内缓存，与数据库会话和收集器的生命周期无关；
+账号行内容变化（AK轮换、region变更、停用）或收到 SIGHUP 时失效重建
 """
 import logging
-from typing import Dict, Optional
+import threading
+from typing import Dict, Optional, Tuple
 from alibabacloud_das20200116.client import Client as DAS20200116Client
 from alibabacloud_credentials.client import Client as CredentialClient
 from alibabacloud_tea_openapi import models as open_api_models
 
 from config.settings import settings
 from utils.encryption import decrypt_string
-from models.instance import AliyunAccount
+from services.inventory import InventoryIndex, get_inventory
 
 
 logger = logging.getLogger(__name__)
 
 
+class CachedClient:
+    """缓存的客户端及其对应的账号行指纹"""
+
+    __slots__ = ('client', 'endpoint', 'fingerprint')
+
+    def __init__(self, client: DAS20200116Client, endpoint: str, fingerprint: Tuple):
+        self.client = client
+        self.endpoint = endpoint
+        self.fingerprint = fingerprint
+
+
 class AliyunClientManager:
     """
     阿里云客户端管理器
     """
     
-    def __init__(self, db_session):
-        self.db_session = db_session
-        self.client_cache: Dict[str, DAS20200116Client] = {}
+    def __init__(self, inventory: InventoryIndex):
+        self.inventory = inventory
+        self.client_cache: Dict[str, CachedClient] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(account) -> Tuple:
+        """账号行中影响客户端的字段，任一变化都需要重建客户端"""
+        return (
+            account.access_key_id,
+            account.encrypted_access_key_secret,
+            account.region_id,
+            account.updatetime
+        )
         
     def get_client_for_account(self, aliyun_uid: str) -> Optional[DAS20200116Client]:
         """
         获取指定阿里云账号的客户端实例
         """
-        # 检查缓存中是否已有对应账号的客户端
-        if aliyun_uid in self.client_cache:
-            return self.client_cache[aliyun_uid]
-        
-        # 从数据库获取账号信息
-        account = self.db_session.query(AliyunAccount).filter(
-            AliyunAccount.aliyun_uid == aliyun_uid,
-            AliyunAccount.status == 1
-        ).first()
+        # 从实例清单索引获取账号信息
+        account = self.inventory.get_account(aliyun_uid)
         
         if not account:
+            if self.client_cache.pop(aliyun_uid, None):
+                logger.info(f"阿里云账号 {aliyun_uid} 已停用或删除，移除缓存的DAS客户端")
             logger.error(f"未找到阿里云账号信息: {aliyun_uid}")
             return None
         
-        try:
-            # 解密Access Key Secret
-            access_key_secret = decrypt_string(account.encrypted_access_key_secret)
-            
-            # 创建使用指定账号认证的配置
-            config = open_api_models.Config(
-                access_key_id=account.access_key_id,
-                access_key_secret=access_key_secret
-            )
-            # 使用配置化的endpoint
-            config.endpoint = settings.DAS_API_ENDPOINT.format(region_id=account.region_id)
-            
-            client = DAS20200116Client(config)
-            
-            # 缓存客户端实例
-            self.client_cache[aliyun_uid] = client
-            
-            logger.info(f"成功创建阿里云账号 {aliyun_uid} 的DAS客户端")
-            return client
+        # 检查缓存中的客户端是否仍对应当前账号信息
+        fingerprint = self._fingerprint(account)
+        cached = self.client_cache.get(aliyun_uid)
+        if cached and cached.fingerprint == fingerprint:
+            return cached.client
+        
+        with self._lock:
+            cached = self.client_cache.get(aliyun_uid)
+            if cached and cached.fingerprint == fingerprint:
+                return cached.client
+            if cached:
+                logger.info(f"阿里云账号 {aliyun_uid} 信息已变更，重建DAS客户端")
             
-        except Exception as e:
-            logger.error(f"创建阿里云账号 {aliyun_uid} 的DAS客户端失败: {str(e)}")
-            return None
\ No newline at end of file
+            try:
+                # 解密Access Key Secret
+                access_key_secret = decrypt_string(account.encrypted_access_key_secret)
+                
+                # 创建使用指定账号认证的配置
+                config = open_api_models.Config(
+                    access_key_id=account.access_key_id,
+                    access_key_secret=access_key_secret
+                )
+                # 使用配置化的endpoint
+                endpoint = self._endpoint(account)
+                config.endpoint = endpoint
+                
+                client = DAS20200116Client(config)
+                
+                # 缓存客户端实例
+                self.client_cache[aliyun_uid] = CachedClient(client, endpoint, fingerprint)
+                
+                logger.info(f"成功创建阿里云账号 {aliyun_uid} 的DAS客户端")
+                return client
+                
+            except Exception as e:
+                logger.error(f"创建阿里云账号 {aliyun_uid} 的DAS客户端失败: {str(e)}")
+                return None
+    
+    @staticmethod
+    def _endpoint(account) -> str:
+        """账号所在region的DAS endpoint"""
+        return settings.DAS_API_ENDPOINT.format(region_id=account.region_id)
+    
+    def get_endpoint_for_account(self, aliyun_uid: str) -> str:
+        """
+        获取账号对应的DAS endpoint（用于区分限流器）
+        按实例清单中的账号region计算，与客户端缓存是否已建立或被 SIGHUP 清空无关；
+        账号不存在时返回空字符串
+        """
+        account = self.inventory.get_account(aliyun_uid)
+        return self._endpoint(account) if account else ''
+
+    def invalidate(self, aliyun_uid: Optional[str] = None):
+        """
+        失效缓存的客户端，不指定账号时全部失效
+        """
+        with self._lock:
+            if aliyun_uid is None:
+                count = len(self.client_cache)
+                self.client_cache.clear()
+                logger.info(f"已清空全部DAS客户端缓存 ({count} 个)")
+            elif self.client_cache.pop(aliyun_uid, None):
+                logger.info(f"已失效阿里云账号 {aliyun_uid} 的DAS客户端缓存")
+
+
+_client_manager: Optional[AliyunClientManager] = None
+
+
+def get_client_manager() -> AliyunClientManager:
+    """获取全局客户端管理器"""
+    global _client_manager
+    if _client_manager is None:
+        _client_manager = AliyunClientManager(get_inventory())
+    return _client_manager
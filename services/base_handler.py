@@ -6,14 +6,25 @@ import asyncio
 import logging
 import time
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from concurrent.futures import ThreadPoolExecutor
 
 from alibabacloud_das20200116 import models as das20200116_models
 from alibabacloud_tea_util import models as util_models
 
+from config.settings import settings
 from models.instance import InstanceList
 from services.aliyun_client_manager import AliyunClientManager
+from services.cardinality import partition_top_k, top_k
+from services.das_errors import (
+    API_ERRORS, PERMANENT, THROTTLING, DASAPIError, classify_error, error_code, retry_delay
+)
+from services.exporter_metrics import das_api_errors, das_api_retries
+from services.inventory import InventoryIndex
+from services.rate_limiter import TokenBucket, get_rate_limiter
+from services.session_churn import get_churn_tracker
+from services.session_parser import build_raw_call, parse_session_response, read_raw_body
+from services.session_snapshot import CLIENT_OTHER, USER_OTHER, UTILIZATION_LABELS, Sample, TargetSessions
 
 
 logger = logging.getLogger(__name__)
@@ -30,150 +41,398 @@ def get_executor(max_workers: int = 10) -> ThreadPoolExecutor:
     return _executor
 
 
+class DeadlineExceeded(Exception):
+    """等待限流后已来不及在时间预算内完成，本次不再调用API"""
+
+
+class SessionTarget:
+    """
+    会话采集目标
+    RDS实例对应一个目标，PolarDB实例的每个节点各对应一个目标
+    """
+    
+    def __init__(self, instance: InstanceList, node_id: str = '', node_type_label: str = 'write'):
+        self.instance = instance
+        self.node_id = node_id
+        self.node_type_label = node_type_label
+    
+    @property
+    def key(self) -> Tuple[str, str]:
+        """目标唯一键 (ins_id, node_id)"""
+        return self.instance.ins_id, self.node_id
+    
+    def __repr__(self) -> str:
+        if self.node_id:
+            return f"{self.instance.ins_id}/{self.node_id}"
+        return self.instance.ins_id
+
+
 class BaseHandler(ABC):
     """
     基础处理器抽象类
-    提供公共的限流、轮询和解析逻辑
+    提供公共的限流、提交、轮询和解析逻辑
+    限流使用按账号共享的全局令牌桶，见 services.rate_limiter
     """
     
-    def __init__(self, db_session, client_manager: AliyunClientManager, rate_limit: float = 5.0):
-        self.db_session = db_session
+    def __init__(self, inventory: InventoryIndex, client_manager: AliyunClientManager):
+        self.inventory = inventory
         self.client_manager = client_manager
-        self.rate_limit = rate_limit  # 每秒API调用次数限制
-        self._last_call_time = 0
-        self._rate_lock = asyncio.Lock()
         
-    async def _rate_limit_delay(self):
+    def _get_limiter(self, aliyun_uid: str) -> TokenBucket:
+        """获取账号和endpoint共享的全局令牌桶"""
+        endpoint = self.client_manager.get_endpoint_for_account(aliyun_uid)
+        return get_rate_limiter(aliyun_uid, endpoint)
+
+    async def _rate_limit_delay(self, aliyun_uid: str, latest_start: Optional[float] = None):
         """
-        实现API调用限流（线程安全）
+        实现API调用限流（按账号共享全局令牌桶）
+        latest_start: 最晚发起调用的时间（time.monotonic），排队等待会超过时归还令牌并抛出 DeadlineExceeded
         """
-        async with self._rate_lock:
-            current_time = time.time()
-            min_interval = 1.0 / self.rate_limit
-            time_since_last_call = current_time - self._last_call_time
-            if time_since_last_call < min_interval:
-                await asyncio.sleep(min_interval - time_since_last_call)
-            self._last_call_time = time.time()
+        limiter = self._get_limiter(aliyun_uid)
+        wait_time = limiter.reserve()
+        if latest_start is not None and time.monotonic() + wait_time > latest_start:
+            limiter.refund()
+            raise DeadlineExceeded()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
     
-    async def _execute_api_call(self, client, request) -> Optional[Any]:
+    async def _invoke(self, client, request) -> Any:
         """
-        执行API调用（使用全局线程池）
+        发起一次API调用并返回响应体
+        DAS_RESPONSE_PARSER=fast 时以字符串读取原始响应体并轻量解析，sdk 时使用SDK模型
         """
-        await self._rate_limit_delay()
-        
-        try:
-            runtime = util_models.RuntimeOptions()
-            loop = asyncio.get_running_loop()
-            executor = get_executor()
-            
+        runtime = util_models.RuntimeOptions()
+        executor_mode = settings.DAS_API_TRANSPORT == 'executor'
+        loop = asyncio.get_running_loop()
+
+        if settings.DAS_RESPONSE_PARSER == 'fast':
+            call = build_raw_call(request)
+            if executor_mode:
+                response = await loop.run_in_executor(
+                    get_executor(settings.THREAD_POOL_SIZE),
+                    lambda: client.call_api(call['params'], call['request'], runtime)
+                )
+            else:
+                response = await client.call_api_async(call['params'], call['request'], runtime)
+            return parse_session_response(read_raw_body(response), settings.SESSION_CHURN_ENABLED)
+
+        if executor_mode:
             response = await loop.run_in_executor(
-                executor,
+                get_executor(settings.THREAD_POOL_SIZE),
                 lambda: client.get_my_sqlall_session_async_with_options(request, runtime)
             )
-            return response.body
-        except Exception as e:
-            logger.error(f"API调用失败: {str(e)}")
+        else:
+            response = await client.get_my_sqlall_session_async_with_options_async(request, runtime)
+        return response.body
+
+    async def _execute_api_call(
+        self,
+        client,
+        request,
+        aliyun_uid: str,
+        latest_start: Optional[float] = None
+    ) -> Optional[Any]:
+        """
+        执行API调用
+        默认使用SDK原生异步接口，DAS_API_TRANSPORT=executor 时回退到线程池调用同步接口
+        流控错误降低账号速率后重试，临时错误按指数退避加抖动重试，最多重试 API_MAX_RETRIES 次，
+        重试用尽后返回None；权限、实例不存在等永久错误不重试，直接抛出 DASAPIError；
+        SDK和网络以外的异常（代码错误、响应解析错误）不重试也不计入API错误，直接抛出
+        latest_start: 最晚发起调用的时间（time.monotonic），来不及时抛出 DeadlineExceeded
+        """
+        attempt = 0
+        while True:
+            await self._rate_limit_delay(aliyun_uid, latest_start)
+
+            try:
+                body = await self._invoke(client, request)
+                self._get_limiter(aliyun_uid).on_success()
+                return body
+            except API_ERRORS as e:
+                kind = classify_error(e)
+                das_api_errors.labels(kind=kind).inc()
+                if kind == PERMANENT:
+                    logger.error(f"API调用失败（不重试）: {str(e)}")
+                    raise DASAPIError(kind, error_code(e), str(e)) from e
+                if kind == THROTTLING:
+                    limiter = self._get_limiter(aliyun_uid)
+                    if limiter.on_throttled():
+                        logger.warning(f"阿里云账号 {aliyun_uid} 触发DAS流控，速率降为 {limiter.rate:.1f} 次/秒")
+                if attempt >= settings.API_MAX_RETRIES:
+                    logger.error(f"API调用失败: {str(e)}")
+                    return None
+
+            attempt += 1
+            das_api_retries.labels(kind=kind).inc()
+            if kind != THROTTLING:
+                # 流控重试的等待由降速后的令牌桶决定
+                delay = retry_delay(attempt)
+                if latest_start is not None and time.monotonic() + delay > latest_start:
+                    raise DeadlineExceeded()
+                logger.debug(f"API调用失败，{delay:.2f} 秒后第 {attempt} 次重试: {kind}")
+                await asyncio.sleep(delay)
+    
+    def _build_request(
+        self,
+        target: SessionTarget,
+        result_id: Optional[str] = None
+    ) -> das20200116_models.GetMySQLAllSessionAsyncRequest:
+        """
+        构建GetMySQLAllSessionAsync请求，node_id只有PolarDB才需要
+        """
+        request = das20200116_models.GetMySQLAllSessionAsyncRequest(
+            instance_id=target.instance.ins_id
+        )
+        if target.node_id:
+            request.node_id = target.node_id
+        if result_id:
+            request.result_id = result_id
+        return request
+    
+    async def submit_session_job(
+        self,
+        client,
+        target: SessionTarget,
+        latest_start: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        第一次调用：提交会话采集任务，返回结果ID
+        """
+        response_data = await self._execute_api_call(
+            client, self._build_request(target), target.instance.aliyun_uid, latest_start
+        )
+        if not response_data:
+            logger.warning(f"无法提交 {target} 的会话采集任务")
+            return None
+        if self.is_error_response(response_data):
+            logger.error(
+                f"提交 {target} 的会话采集任务返回错误: {response_data.code} {response_data.message}"
+            )
             return None
+        
+        result_id = response_data.data.result_id
+        if not result_id:
+            logger.error(f"{target} 未返回结果ID")
+            return None
+        return result_id
     
-    async def _poll_async_result(
-        self, 
-        client, 
-        ins_id: str, 
-        result_id: str, 
-        node_id: Optional[str] = None,
-        max_attempts: int = 30,
-        poll_interval: float = 1.0
+    async def poll_session_job(
+        self,
+        client,
+        target: SessionTarget,
+        result_id: str,
+        latest_start: Optional[float] = None
     ) -> Optional[Any]:
         """
-        轮询获取异步结果
+        轮询一次异步结果，是否完成由调用方根据 is_finish/state 判断
         """
-        attempt = 0
+        return await self._execute_api_call(
+            client, self._build_request(target, result_id), target.instance.aliyun_uid, latest_start
+        )
+    
+    @staticmethod
+    def is_error_response(response_data: Any) -> bool:
+        """
+        检查是否为业务错误响应
+        HTTP 200 但 Success 为false或没有 Data，例如 {"Code":"-1","Success":false}
+        """
+        return response_data.data is None or str(getattr(response_data, 'success', None)).lower() == 'false'
+    
+    @staticmethod
+    def is_job_failed(response_data: Any) -> bool:
+        """检查异步任务是否失败（业务错误响应也视为失败）"""
+        if BaseHandler.is_error_response(response_data):
+            return True
+        state = getattr(response_data.data, 'state', None)
+        return bool(state) and state.lower() == 'fail'
+    
+    def build_session_items(self, target: SessionTarget, response_data: Any) -> TargetSessions:
+        """
+        将已完成的异步结果解析为会话数据项
+        一次遍历同时生成各用户会话数、活跃会话数、目标总会话数和计算利用率用的各用户会话数，
+        开启 SESSION_CHURN_ENABLED 时同时统计各用户新建/关闭的会话数
+        """
+        collected_at = time.time()
+        if self.is_job_failed(response_data):
+            logger.error(f"{target} 获取会话数据失败")
+            return TargetSessions((), collected_at)
         
-        # 构建请求
-        if node_id:
-            request = das20200116_models.GetMySQLAllSessionAsyncRequest(
-                instance_id=ins_id,
-                node_id=node_id,
-                result_id=result_id
-            )
-        else:
-            request = das20200116_models.GetMySQLAllSessionAsyncRequest(
-                instance_id=ins_id,
-                result_id=result_id
-            )
+        session_data_result = response_data.data.session_data
+        if not session_data_result:
+            logger.warning(f"{target} 未返回会话数据")
+            return TargetSessions((), collected_at)
         
-        while attempt < max_attempts:
-            try:
-                response_data = await self._execute_api_call(client, request)
-                if not response_data:
-                    return None
-                
-                # 检查是否完成
-                if response_data.data.is_finish:
-                    logger.debug(f"轮询结果 {result_id} 完成")
-                    return response_data
-                
-                # 如果失败，直接返回
-                if hasattr(response_data.data, 'state') and response_data.data.state.lower() == 'fail':
-                    logger.error(f"轮询结果 {result_id} 失败")
-                    return response_data
-                
-                attempt += 1
-                await asyncio.sleep(poll_interval)
-                
-            except Exception as e:
-                logger.error(f"轮询结果 {result_id} 异常: {str(e)}")
-                return None
+        user_stats = self._parse_user_session_stats(session_data_result)
+        session_sum = sum(stat['session_count'] for stat in user_stats)
+        user_counts = self._build_user_counts(target, user_stats)
+        
+        samples = []
+        active_samples = []
+        kept_labels = set()
+        for stat in self._limit_user_stats(target, user_stats):
+            label_values = self._build_label_values(
+                target.instance, stat['db_user'], target.node_id, target.node_type_label
+            )
+            samples.append((label_values, stat['session_count']))
+            active_samples.append((label_values, stat['active_count']))
+            kept_labels.add(label_values)
         
-        logger.warning(f"轮询结果 {result_id} 超时 (尝试 {max_attempts} 次)")
-        return None
+        # TotalSessionCount 缺失时用各用户会话数之和（合并前，总数不受 USER_TOP_K 影响）
+        total_count = getattr(session_data_result, 'total_session_count', None)
+        total = (
+            self._build_label_values(target.instance, None, target.node_id, target.node_type_label),
+            total_count if total_count is not None else session_sum
+        )
+        client_samples = self._build_client_samples(target, session_data_result)
+        opened_samples, closed_samples = (), ()
+        if settings.SESSION_CHURN_ENABLED:
+            opened_samples, closed_samples = self._build_churn_samples(target, user_stats, kept_labels)
+        return TargetSessions(
+            tuple(samples), collected_at, tuple(active_samples), total, client_samples,
+            opened_samples, closed_samples, user_counts
+        )
+    
+    def _build_user_counts(self, target: SessionTarget, user_stats: List[Dict[str, Any]]) -> Tuple[Sample, ...]:
+        """
+        有 max_user_connections 上限的各用户会话数，用于计算会话利用率
+        在 USER_TOP_K 合并前生成，会话数少但上限也小的用户不会因合并而缺失
+        """
+        ins_id = target.instance.ins_id
+        counts: Dict[str, int] = {}
+        for stat in user_stats:
+            if self.inventory.max_connections.get((ins_id, stat['db_user'])):
+                counts[stat['db_user']] = counts.get(stat['db_user'], 0) + stat['session_count']
+        return tuple(
+            (self._build_label_values(target.instance, db_user)[:len(UTILIZATION_LABELS)], count)
+            for db_user, count in counts.items()
+        )
+    
+    def _build_churn_samples(
+        self,
+        target: SessionTarget,
+        user_stats: List[Dict[str, Any]],
+        kept_labels: Set[Tuple[str, ...]]
+    ) -> Tuple[Tuple[Sample, ...], Tuple[Sample, ...]]:
+        """
+        各用户累计新建/关闭会话数
+        按 USER_TOP_K 合并前的各用户线程ID对比，用户进出前K名不会被算作会话新建和关闭；
+        对比后不在 kept_labels 中的用户（含本次消失的用户）的计数合并为 db_user="__other__"
+        """
+        opened, closed = get_churn_tracker().observe(target.key, [
+            (
+                self._build_label_values(target.instance, stat['db_user'], target.node_id, target.node_type_label),
+                stat['thread_ids']
+            )
+            for stat in user_stats
+        ])
+        other_labels = self._build_label_values(
+            target.instance, USER_OTHER, target.node_id, target.node_type_label
+        )
+        return (
+            self._fold_user_samples(opened, kept_labels, other_labels),
+            self._fold_user_samples(closed, kept_labels, other_labels)
+        )
+    
+    @staticmethod
+    def _fold_user_samples(
+        samples: Tuple[Sample, ...],
+        kept_labels: Set[Tuple[str, ...]],
+        other_labels: Tuple[str, ...]
+    ) -> Tuple[Sample, ...]:
+        """保留 kept_labels 中的序列，其余序列的值求和为 other_labels 一条序列"""
+        folded = []
+        other = None
+        for label_values, value in samples:
+            if label_values in kept_labels:
+                folded.append((label_values, value))
+            else:
+                other = (other or 0) + value
+        if other is not None:
+            folded.append((other_labels, other))
+        return tuple(folded)
+    
+    def _limit_user_stats(self, target: SessionTarget, user_stats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        只保留会话数最多的 USER_TOP_K 个用户（USER_TOP_K_OVERRIDES 按 ins_id 覆盖），
+        其余用户的会话数和活跃会话数合并为 db_user="__other__"
+        """
+        k = settings.USER_TOP_K_OVERRIDES.get(target.instance.ins_id, settings.USER_TOP_K)
+        kept, rest = partition_top_k(user_stats, k, lambda stat: stat['session_count'])
+        if rest:
+            kept.append({
+                'db_user': USER_OTHER,
+                'session_count': sum(stat['session_count'] for stat in rest),
+                'active_count': sum(stat['active_count'] for stat in rest)
+            })
+        return kept
+    
+    def _build_client_samples(self, target: SessionTarget, session_data: Any) -> Tuple[Sample, ...]:
+        """
+        按 ClientStats 生成各客户端IP的会话数
+        只保留会话数最多的 CLIENT_TOP_K 个IP，其余合并为 client_ip="other" 一条序列
+        """
+        client_counts = [
+            (client_stat.key, client_stat.total_count or 0)
+            for client_stat in getattr(session_data, 'client_stats', None) or []
+            if client_stat.key
+        ]
+        kept, other = top_k(client_counts, settings.CLIENT_TOP_K)
+        if other is not None:
+            kept.append((CLIENT_OTHER, other))
+        return tuple(
+            (self._build_label_values(target.instance, client_ip, target.node_id, target.node_type_label), count)
+            for client_ip, count in kept
+        )
     
     def _parse_user_session_stats(self, session_data: Any) -> List[Dict[str, Any]]:
         """
         解析用户会话统计信息
         """
-        user_stats = session_data.user_stats
+        user_stats = session_data.user_stats or []
         parsed_stats = []
         
         for user_stat in user_stats:
             user_list = user_stat.user_list
-            total_count = user_stat.total_count
+            total_count = user_stat.total_count or 0
+            active_count = user_stat.active_count or 0
+            thread_ids = user_stat.thread_id_list or []
             
             for user in user_list:
                 parsed_stats.append({
                     'db_user': user,
-                    'session_count': total_count
+                    'session_count': total_count,
+                    'active_count': active_count,
+                    'thread_ids': thread_ids
                 })
         
         return parsed_stats
     
-    def _build_session_data_item(
+    def _build_label_values(
         self,
         instance: InstanceList,
-        stat: Dict[str, Any],
+        dimension: Optional[str],
         node_id: str = '',
-        node_type_label: str = 'write',
-        session_data: Any = None
-    ) -> Dict[str, Any]:
-        """
-        构建会话数据项
-        """
-        return {
-            'labels': {
-                'ins_id': instance.ins_id,
-                'ins_name': instance.ins_name,
-                'ins_type': instance.ins_type.lower(),
-                'aliyun_uid': instance.aliyun_uid,
-                'db_user': stat['db_user'],
-                'node_id': node_id,
-                'node_type': node_type_label
-            },
-            'session_count': stat['session_count']
-        }
+        node_type_label: str = 'write'
+    ) -> Tuple[str, ...]:
+        """
+        构建label值元组
+        dimension 为 db_user 时按 SESSION_LABELS 顺序，为 client_ip 时按 CLIENT_LABELS 顺序，
+        为None时按 INSTANCE_TOTAL_LABELS 顺序
+        """
+        dimension_labels = (dimension,) if dimension is not None else ()
+        return (
+            instance.ins_id,
+            instance.ins_name,
+            instance.ins_type.lower(),
+            instance.aliyun_uid,
+            *dimension_labels,
+            node_id,
+            node_type_label
+        )
     
     @abstractmethod
-    async def get_session_data_for_instance(self, instance: InstanceList) -> List[Dict[str, Any]]:
+    def get_targets(self, instance: InstanceList) -> List[SessionTarget]:
         """
-        获取实例的会话数据（子类实现）
+        获取实例的采集目标列表（子类实现）
         """
         pass
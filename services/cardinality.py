@@ -0,0 +1,33 @@
+"""
+序列基数控制
+按值保留前K条序列，其余合并为一条汇总序列，使单个目标导出的序列数有上限
+"""
+from typing import Callable, Hashable, List, Optional, Tuple, TypeVar
+
+
+T = TypeVar('T')
+
+
+def partition_top_k(items: List[T], k: int, value: Callable[[T], float]) -> Tuple[List[T], List[T]]:
+    """
+    按 value 取值最大的K项
+    返回 (保留的项, 其余项)；k <= 0 或不超过K项时全部保留，不改变顺序
+    """
+    if k <= 0 or len(items) <= k:
+        return list(items), []
+    ordered = sorted(items, key=value, reverse=True)
+    return ordered[:k], ordered[k:]
+
+
+def top_k(
+    items: List[Tuple[Hashable, float]],
+    k: int
+) -> Tuple[List[Tuple[Hashable, float]], Optional[float]]:
+    """
+    取值最大的K项
+    返回 (保留的项, 其余项的值之和)，没有被合并的项时和为None；k <= 0 表示不限制
+    """
+    kept, rest = partition_top_k(items, k, lambda item: item[1])
+    if not rest:
+        return kept, None
+    return kept, sum(value for _, value in rest)
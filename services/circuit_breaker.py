@@ -0,0 +1,181 @@
+"""
+DAS采集熔断器
+按采集目标 (ins_id, node_id) 和阿里云账号分别熔断：连续失败达到阈值后打开，
+冷却期内不再提交任务，冷却结束后半开放行一次探测，探测失败则冷却时间翻倍；
+实例不存在、无权限等永久错误直接打开目标熔断；
+熔断期间快照保留该目标最后一次成功的结果
+"""
+import logging
+import time
+from typing import Container, Dict, Optional, Tuple
+
+from config.settings import settings
+from services.base_handler import SessionTarget
+from services.exporter_metrics import das_account_breaker_state, das_breaker_trips, das_target_breaker_state
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 熔断状态的指标值
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """单个熔断器"""
+
+    def __init__(self, threshold: int):
+        self.threshold = max(threshold, 1)
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = settings.BREAKER_COOLDOWN
+        self.opened_at = 0.0
+        self.probe_started_at: Optional[float] = None
+
+    def allow(self, now: float) -> bool:
+        """
+        是否允许发起采集
+        冷却结束后转为半开，同一时间只放行一次探测；探测超过 POLL_TIMEOUT 仍无结果时允许重新探测
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+        if self.probe_started_at is not None and now - self.probe_started_at < settings.POLL_TIMEOUT:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def release(self):
+        """探测未得到结果（如超出时间预算未提交），允许下次重新探测"""
+        self.probe_started_at = None
+
+    def record_success(self):
+        """采集成功，关闭熔断并重置冷却时间"""
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = settings.BREAKER_COOLDOWN
+        self.probe_started_at = None
+
+    def record_failure(self, now: float, permanent: bool = False) -> bool:
+        """采集失败，返回是否因此打开熔断；permanent 为永久错误，不等连续失败达到阈值"""
+        self.probe_started_at = None
+        if self.state == HALF_OPEN:
+            # 探测失败，冷却时间指数增长
+            self.cooldown = min(self.cooldown * 2, settings.BREAKER_MAX_COOLDOWN)
+            self._open(now)
+            return True
+        self.failures += 1
+        if self.state == CLOSED and (permanent or self.failures >= self.threshold):
+            self._open(now)
+            return True
+        return False
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self.opened_at = now
+
+
+class BreakerRegistry:
+    """目标和账号熔断器注册表"""
+
+    def __init__(self):
+        self.targets: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.accounts: Dict[str, CircuitBreaker] = {}
+
+    def _target_breaker(self, target: SessionTarget) -> CircuitBreaker:
+        breaker = self.targets.get(target.key)
+        if breaker is None:
+            breaker = self.targets[target.key] = CircuitBreaker(settings.BREAKER_FAILURE_THRESHOLD)
+        return breaker
+
+    def _account_breaker(self, aliyun_uid: str) -> CircuitBreaker:
+        breaker = self.accounts.get(aliyun_uid)
+        if breaker is None:
+            breaker = self.accounts[aliyun_uid] = CircuitBreaker(settings.BREAKER_ACCOUNT_FAILURE_THRESHOLD)
+        return breaker
+
+    def _export(self, target: SessionTarget):
+        """更新目标和所属账号的熔断状态指标"""
+        target_breaker = self.targets.get(target.key)
+        if target_breaker is not None:
+            das_target_breaker_state.labels(
+                ins_id=target.instance.ins_id, node_id=target.node_id
+            ).set(STATE_VALUES[target_breaker.state])
+        account_breaker = self.accounts.get(target.instance.aliyun_uid)
+        if account_breaker is not None:
+            das_account_breaker_state.labels(
+                aliyun_uid=target.instance.aliyun_uid
+            ).set(STATE_VALUES[account_breaker.state])
+
+    def allow(self, target: SessionTarget) -> bool:
+        """账号和目标的熔断器都放行时才允许采集"""
+        if not settings.BREAKER_ENABLED:
+            return True
+        now = time.monotonic()
+        account_breaker = self._account_breaker(target.instance.aliyun_uid)
+        if not account_breaker.allow(now):
+            return False
+        if not self._target_breaker(target).allow(now):
+            # 账号处于半开时放行的探测名额留给其他目标
+            if account_breaker.state == HALF_OPEN:
+                account_breaker.release()
+            return False
+        self._export(target)
+        return True
+
+    def release(self, target: SessionTarget):
+        """采集未发起，归还半开探测名额"""
+        for breaker in (self.targets.get(target.key), self.accounts.get(target.instance.aliyun_uid)):
+            if breaker is not None:
+                breaker.release()
+
+    def record_success(self, target: SessionTarget):
+        """记录采集成功"""
+        self._target_breaker(target).record_success()
+        self._account_breaker(target.instance.aliyun_uid).record_success()
+        self._export(target)
+
+    def record_failure(self, target: SessionTarget, permanent: bool = False):
+        """
+        记录采集失败（提交失败、轮询失败、任务失败或轮询超时）
+        permanent: 永久错误（实例不存在、无权限等），直接打开目标熔断
+        """
+        now = time.monotonic()
+        target_breaker = self._target_breaker(target)
+        if target_breaker.record_failure(now, permanent):
+            das_breaker_trips.labels(scope='target').inc()
+            reason = '永久错误' if permanent else '连续采集失败'
+            logger.warning(f"{target} {reason}，熔断 {target_breaker.cooldown:.0f} 秒")
+        account_breaker = self._account_breaker(target.instance.aliyun_uid)
+        if account_breaker.record_failure(now):
+            das_breaker_trips.labels(scope='account').inc()
+            logger.warning(
+                f"阿里云账号 {target.instance.aliyun_uid} 连续采集失败，熔断 {account_breaker.cooldown:.0f} 秒"
+            )
+        self._export(target)
+
+    def retain(self, keys: Container[Tuple[str, str]]):
+        """删除不再采集的目标的熔断器和状态指标"""
+        for key in [key for key in self.targets if key not in keys]:
+            del self.targets[key]
+            try:
+                das_target_breaker_state.remove(*key)
+            except KeyError:
+                pass
+
+
+_breakers: Optional[BreakerRegistry] = None
+
+
+def get_breakers() -> BreakerRegistry:
+    """获取全局熔断器注册表"""
+    global _breakers
+    if _breakers is None:
+        _breakers = BreakerRegistry()
+    return _breakers
@@ -0,0 +1,250 @@
+"""
+采集调度器
+continuous 模式下每个目标按自己的采集间隔独立调度，并按 (ins_id, node_id) 的稳定哈希
+在间隔内分配固定相位，DAS调用均匀分布在整个间隔内，目标完成即合并进快照；
+cycle 模式保留每个间隔集中采集一轮的方式
+"""
+import asyncio
+import heapq
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+from services.base_handler import SessionTarget
+from services.exporter_metrics import das_scheduled_targets
+from services.metrics_collector import MetricsCollector, get_metrics_collector, peek_metrics_collector
+from services.sharding import stable_hash
+
+
+logger = logging.getLogger(__name__)
+
+
+class TargetSchedule:
+    """单个目标的调度信息"""
+
+    __slots__ = ('target', 'interval', 'phase', 'next_due')
+
+    def __init__(self, target: SessionTarget, interval: int, phase: float, next_due: float):
+        self.target = target
+        self.interval = interval
+        self.phase = phase
+        self.next_due = next_due
+
+
+class CollectionScheduler:
+    """
+    指标采集调度器
+    调度时刻按墙上时间对齐：next_due = k * interval + phase，
+    重启或多副本部署时同一目标的采集时刻保持不变
+    """
+
+    def __init__(self):
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        self._schedules: Dict[Tuple[str, str], TargetSchedule] = {}
+        self._heap: List[Tuple[float, Tuple[str, str]]] = []
+        self._in_flight: Set[Tuple[str, str]] = set()
+        self._batches: Set[asyncio.Task] = set()
+        self._planned_loaded_at: float = -1
+
+        # 周期汇总日志
+        self._window_started = time.time()
+        self._window_scheduled = 0
+        self._window_completed = 0
+
+    @property
+    def continuous(self) -> bool:
+        """是否正在按目标持续调度（此时 /metrics 不再触发整轮采集）"""
+        return self._running and settings.SCHEDULER_MODE == 'continuous'
+
+    @staticmethod
+    def target_interval(target: SessionTarget) -> int:
+        """目标的采集间隔，覆盖配置优先（ins_id/node_id 优先于 ins_id）"""
+        overrides = settings.TARGET_INTERVAL_OVERRIDES
+        ins_id, node_id = target.key
+        names = [f"{ins_id}/{node_id}", ins_id] if node_id else [ins_id]
+        for name in names:
+            if name in overrides:
+                return max(int(overrides[name]), 1)
+        if target.node_type_label == 'write':
+            return max(settings.TARGET_INTERVAL_WRITE, 1)
+        return max(settings.TARGET_INTERVAL_READ, 1)
+
+    @staticmethod
+    def target_phase(key: Tuple[str, str], interval: int) -> float:
+        """目标在间隔内的固定相位（秒）"""
+        return stable_hash('/'.join(key)) % (interval * 1000) / 1000
+
+    @staticmethod
+    def next_slot(now: float, interval: int, phase: float) -> float:
+        """now 之后目标的下一个采集时刻"""
+        return (math.floor((now - phase) / interval) + 1) * interval + phase
+
+    def _plan(self, collector: MetricsCollector):
+        """根据实例清单和分片归属重建调度表，已有目标保留原调度时刻"""
+        instances = collector.shard_selector.filter_instances(collector.inventory.instances)
+        targets = collector.das_client.get_targets(instances)
+
+        now = time.time()
+        schedules: Dict[Tuple[str, str], TargetSchedule] = {}
+        for target in targets:
+            interval = self.target_interval(target)
+            schedule = self._schedules.get(target.key)
+            if schedule and schedule.interval == interval:
+                # 目标对象引用最新的清单行
+                schedule.target = target
+            else:
+                phase = self.target_phase(target.key, interval)
+                schedule = TargetSchedule(target, interval, phase, self.next_slot(now, interval, phase))
+            schedules[target.key] = schedule
+
+        self._schedules = schedules
+        self._heap = [(schedule.next_due, key) for key, schedule in schedules.items()]
+        heapq.heapify(self._heap)
+        self._planned_loaded_at = collector.inventory.loaded_at
+
+        collector.retain_targets(set(schedules))
+        das_scheduled_targets.set(len(schedules))
+        logger.debug(f"调度表已更新，共 {len(schedules)} 个目标")
+
+    def _pop_due(self, now: float) -> List[SessionTarget]:
+        """取出到期的目标并安排下一次采集，上一次采集仍未完成的目标本次跳过"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, key = heapq.heappop(self._heap)
+            schedule = self._schedules.get(key)
+            if schedule is None or schedule.next_due != due_at:
+                # 调度表重建后遗留的过期条目
+                continue
+            schedule.next_due = self.next_slot(now, schedule.interval, schedule.phase)
+            heapq.heappush(self._heap, (schedule.next_due, key))
+            if key in self._in_flight:
+                logger.debug(f"{schedule.target} 上一次采集尚未完成，跳过本次调度")
+                continue
+            due.append(schedule.target)
+        return due
+
+    async def _collect(self, collector: MetricsCollector, targets: List[SessionTarget]):
+        """
+        采集一批到期目标，结果逐个目标合并进快照
+        截止时间为这批目标中最早的下一次调度时刻，来不及完成的在下一次调度时继续
+        """
+        keys = {target.key for target in targets}
+        next_due = min(
+            (self._schedules[key].next_due for key in keys if key in self._schedules),
+            default=time.time() + settings.SCHEDULER_TICK
+        )
+        deadline = time.monotonic() + max(next_due - time.time(), 0)
+        self._in_flight |= keys
+        try:
+            self._window_completed += await collector.collect_targets(targets, deadline)
+        except Exception as e:
+            logger.error(f"采集 {len(targets)} 个目标失败: {e}")
+        finally:
+            self._in_flight -= keys
+
+    def _log_window(self, collector: MetricsCollector, now: float):
+        """每个 METRICS_UPDATE_INTERVAL 输出一次汇总日志并导出窗口内节省的轮询次数"""
+        elapsed = now - self._window_started
+        if elapsed < settings.METRICS_UPDATE_INTERVAL:
+            return
+        # 各批次节省的轮询次数按窗口汇总后导出一次
+        collector.das_client.pipeline.report_poll_savings()
+        logger.info(
+            f"最近 {elapsed:.0f} 秒调度 {self._window_scheduled} 个目标，完成 {self._window_completed} 个，"
+            f"当前共 {len(self._schedules)} 个目标"
+        )
+        self._window_started = now
+        self._window_scheduled = 0
+        self._window_completed = 0
+
+    async def _tick(self, collector: MetricsCollector):
+        """单次调度：同步清单、必要时重建调度表、启动到期目标的采集"""
+        # 同时按需同步实例清单
+        await collector.collect_max_connections_metrics()
+        if collector.inventory.loaded_at != self._planned_loaded_at:
+            self._plan(collector)
+
+        now = time.time()
+        due = self._pop_due(now)
+        if due:
+            self._window_scheduled += len(due)
+            task = asyncio.create_task(self._collect(collector, due))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+        self._log_window(collector, now)
+
+    async def _continuous_loop(self):
+        """持续调度循环"""
+        collector = get_metrics_collector()
+        while self._running:
+            try:
+                await self._tick(collector)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"调度循环异常: {e}")
+
+            delay = settings.SCHEDULER_TICK
+            if self._heap:
+                delay = min(max(self._heap[0][0] - time.time(), 0), delay)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                break
+
+    async def _cycle_loop(self):
+        """定时采集循环（每个间隔集中采集一轮）"""
+        while self._running:
+            try:
+                await asyncio.sleep(settings.METRICS_UPDATE_INTERVAL)
+
+                if not self._running:
+                    break
+
+                try:
+                    collector = get_metrics_collector()
+                    await collector.collect_all_metrics()
+                    logger.info("定时指标采集完成")
+                except Exception as e:
+                    logger.error(f"定时指标采集失败: {e}")
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"采集循环异常: {e}")
+
+    def start(self):
+        """启动调度器"""
+        self._running = True
+        if settings.SCHEDULER_MODE == 'continuous':
+            self._task = asyncio.create_task(self._continuous_loop())
+        else:
+            self._task = asyncio.create_task(self._cycle_loop())
+        logger.info(f"指标采集调度器已启动 ({settings.SCHEDULER_MODE})")
+
+    async def stop(self):
+        """停止调度器"""
+        self._running = False
+        tasks = [task for task in [self._task, *self._batches] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 采集任务在合并点被保护，不随等待方取消，这里单独取消
+        collector = peek_metrics_collector()
+        if collector:
+            await collector.flights.cancel_all()
+        logger.info("指标采集调度器已停止")
+
+
+_collection_scheduler: Optional[CollectionScheduler] = None
+
+
+def get_collection_scheduler() -> CollectionScheduler:
+    """获取全局采集调度器"""
+    global _collection_scheduler
+    if _collection_scheduler is None:
+        _collection_scheduler = CollectionScheduler()
+    return _collection_scheduler
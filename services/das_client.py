@@ -1,11 +1,14 @@
 """DAS客户端统一入口"""
 import logging
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Optional, Tuple
 
-from services.aliyun_client_manager import AliyunClientManager
+from services.aliyun_client_manager import get_client_manager
+from services.base_handler import BaseHandler, SessionTarget
+from services.inventory import get_inventory
 from services.polardb_handler import PolarDBHandler
 from services.rds_handler import RDSHandler
-from config.settings import settings
+from services.session_pipeline import SessionPipeline
+from services.session_snapshot import TargetSessions
 from models.instance import InstanceList
 
 
@@ -17,19 +20,45 @@ class DASClient:
     阿里云DAS API客户端 - 统一入口
     """
     
-    def __init__(self, db_session):
-        self.db_session = db_session
-        self.client_manager = AliyunClientManager(db_session)
-        # 使用配置的限流参数
-        rate_limit = getattr(settings, 'DAS_API_RATE_LIMIT', 5.0)
-        self.polardb_handler = PolarDBHandler(db_session, self.client_manager, rate_limit)
-        self.rds_handler = RDSHandler(db_session, self.client_manager, rate_limit)
-        
-    async def get_session_data_for_instance(self, instance: InstanceList) -> List[Dict[str, Any]]:
+    def __init__(self):
+        # 实例节点和账号信息来自内存索引，采集过程不访问数据库
+        self.inventory = get_inventory()
+        # 客户端按账号进程内缓存，不随数据库会话重建
+        self.client_manager = get_client_manager()
+        # 限流器按账号全局共享，重建DASClient不会重置限流状态
+        self.polardb_handler = PolarDBHandler(self.inventory, self.client_manager)
+        self.rds_handler = RDSHandler(self.inventory, self.client_manager)
+        self.pipeline = SessionPipeline(self)
+    
+    def get_handler(self, instance: InstanceList) -> BaseHandler:
         """
-        根据实例类型获取会话数据
+        根据实例类型获取处理器
         """
         if instance.ins_type.lower() == 'polardb':
-            return await self.polardb_handler.get_session_data_for_instance(instance)
-        else:  # RDS
-            return await self.rds_handler.get_session_data_for_instance(instance)
+            return self.polardb_handler
+        return self.rds_handler
+    
+    def get_targets(self, instances: List[InstanceList]) -> List[SessionTarget]:
+        """
+        展开实例列表为采集目标列表
+        """
+        targets = []
+        for instance in instances:
+            targets.extend(self.get_handler(instance).get_targets(instance))
+        return targets
+    
+    async def collect_session_data(
+        self,
+        targets: List[SessionTarget],
+        on_result: Optional[Callable[[Tuple[str, str], TargetSessions], None]] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[Tuple[str, str], TargetSessions]:
+        """
+        通过两阶段流水线采集一批目标的会话数据
+        on_result: 单个目标完成时的回调
+        deadline: 截止时间（time.monotonic），超出的目标顺延到下一轮
+        """
+        if not targets:
+            return {}
+        return await self.pipeline.run(targets, on_result, deadline)
+
@@ -0,0 +1,91 @@
+"""
+DAS API错误分类
+throttling: 流控（Throttling.*、HTTP 429/503），降低账号发送速率后重试
+transient: 网络错误和服务端临时错误，带抖动的有限次重试
+permanent: 实例不存在、无权限、参数错误等，重试无意义，直接交给调用方
+兼容新旧两代SDK的异常：按 code 和 status_code/statusCode 属性判断，不依赖具体异常类。
+只有SDK异常和网络/超时异常参与分类，其他异常（代码错误、响应解析错误）不属于API错误，直接抛给调用方
+"""
+import random
+from typing import Optional, Tuple
+
+from Tea.exceptions import RetryError, TeaException
+
+from config.settings import settings
+
+# 新一代SDK（darabonba）的异常继承自 TeaException，只有 RetryError 需要单独列出
+try:
+    from darabonba.exceptions import RetryError as DaraRetryError
+except ImportError:
+    DaraRetryError = RetryError
+
+# 异步接口使用aiohttp，其部分连接异常不继承 OSError
+try:
+    from aiohttp import ClientError
+except ImportError:
+    ClientError = OSError
+
+
+THROTTLING = 'throttling'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# 视为永久错误的错误码关键字
+_PERMANENT_CODE_MARKERS = (
+    'NotFound', 'Forbidden', 'NoPermission', 'Unauthorized', 'InvalidAccessKey',
+    'SignatureDoesNotMatch', 'InvalidParameter', 'MissingParameter', 'NotSupport', 'InvalidInstance'
+)
+
+
+# 参与分类和重试的API异常：SDK异常、SDK重试耗尽、网络和超时错误（TimeoutError、ConnectionError 均为 OSError）
+API_ERRORS: Tuple[type, ...] = (TeaException, RetryError, DaraRetryError, ClientError, OSError)
+
+
+class DASAPIError(Exception):
+    """不可重试的DAS API错误，直接抛给调用方"""
+
+    def __init__(self, kind: str, code: str, message: str):
+        super().__init__(f"{code}: {message}")
+        self.kind = kind
+        self.code = code
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """获取异常中的HTTP状态码"""
+    for attr in ('status_code', 'statusCode'):
+        status = getattr(error, attr, None)
+        if status is not None:
+            break
+    else:
+        data = getattr(error, 'data', None)
+        status = data.get('statusCode') if isinstance(data, dict) else None
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def error_code(error: Exception) -> str:
+    """获取异常中的错误码"""
+    return str(getattr(error, 'code', None) or '')
+
+
+def classify_error(error: Exception) -> str:
+    """对API调用异常分类"""
+    code = error_code(error)
+    status = error_status_code(error)
+
+    if code.startswith('Throttling') or status in (429, 503):
+        return THROTTLING
+    if any(marker in code for marker in _PERMANENT_CODE_MARKERS):
+        return PERMANENT
+    if status is not None and 400 <= status < 500:
+        return PERMANENT
+    # 5xx、连接/读取超时、连接重置及其他无错误码的异常
+    return TRANSIENT
+
+
+def retry_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间：指数退避加全抖动"""
+    delay = min(settings.API_RETRY_BASE_DELAY * (2 ** (attempt - 1)), settings.API_RETRY_MAX_DELAY)
+    return random.uniform(0, delay)
@@ -0,0 +1,94 @@
+"""
+Exporter自身运行指标
+"""
+from prometheus_client import Counter, Gauge
+
+
+das_poll_calls = Counter(
+    'das_exporter_poll_calls',
+    'DAS异步结果轮询调用次数'
+)
+
+das_poll_calls_saved = Counter(
+    'das_exporter_poll_calls_saved',
+    '自适应轮询相比固定间隔轮询节省的调用次数'
+)
+
+das_poll_calls_saved_last_cycle = Gauge(
+    'das_exporter_poll_calls_saved_last_cycle',
+    '最近一轮采集自适应轮询节省的调用次数（continuous 模式为最近一个 METRICS_UPDATE_INTERVAL 内各批次之和）'
+)
+
+das_shard_owned_instances = Gauge(
+    'das_exporter_shard_owned_instances',
+    '本副本负责采集的实例数'
+)
+
+das_collections_joined = Counter(
+    'das_exporter_collections_joined',
+    '加入进行中采集而未重复发起的请求数',
+    ['scope']
+)
+
+das_scheduled_targets = Gauge(
+    'das_exporter_scheduled_targets',
+    '调度器当前负责的采集目标数'
+)
+
+das_targets_skipped = Counter(
+    'das_exporter_targets_skipped',
+    '超出时间预算顺延到下一轮的采集目标次数（stage=submit 未提交，stage=poll 已提交未完成）',
+    ['ins_id', 'node_id', 'stage']
+)
+
+das_carried_over_targets = Gauge(
+    'das_exporter_carried_over_targets',
+    '当前顺延到下一轮的采集目标数'
+)
+
+das_target_breaker_state = Gauge(
+    'das_exporter_target_breaker_state',
+    '采集目标熔断状态（0 关闭 1 打开 2 半开）',
+    ['ins_id', 'node_id']
+)
+
+das_account_breaker_state = Gauge(
+    'das_exporter_account_breaker_state',
+    '阿里云账号熔断状态（0 关闭 1 打开 2 半开）',
+    ['aliyun_uid']
+)
+
+das_breaker_trips = Counter(
+    'das_exporter_breaker_trips',
+    '熔断器打开次数',
+    ['scope']
+)
+
+das_targets_breaker_rejected = Counter(
+    'das_exporter_targets_breaker_rejected',
+    '因熔断未提交的采集目标次数'
+)
+
+das_api_rate_limit = Gauge(
+    'das_exporter_api_rate_limit',
+    '账号当前生效的DAS API调用速率（次/秒），触发流控后按AIMD调整',
+    ['aliyun_uid', 'endpoint']
+)
+
+das_api_errors = Counter(
+    'das_exporter_api_errors',
+    'DAS API调用错误次数（kind=throttling 流控, transient 临时错误, permanent 永久错误）',
+    ['kind']
+)
+
+das_api_retries = Counter(
+    'das_exporter_api_retries',
+    'DAS API调用重试次数',
+    ['kind']
+)
+
+das_series_changed = Counter(
+    'das_exporter_series_changed',
+    '发布快照时新增、值变化和删除的序列数（kind=added/changed/removed）',
+    ['kind']
+)
@@ -0,0 +1,103 @@
+"""
+指标输出缓存
+每个快照只渲染一次Prometheus文本格式，并同时保存原文和gzip压缩版本
+"""
+import asyncio
+import gzip
+import hashlib
+import time
+from typing import Optional
+
+from prometheus_client import generate_latest
+from prometheus_client.registry import CollectorRegistry, REGISTRY
+
+from config.settings import settings
+from services.session_snapshot import get_snapshot_generation
+
+
+class RenderedExposition:
+    """一次渲染的结果"""
+
+    __slots__ = ('generation', 'rendered_at', 'identity', 'gzip', 'etag')
+
+    def __init__(self, generation: int, identity: bytes):
+        self.generation = generation
+        self.rendered_at = time.monotonic()
+        self.identity = identity
+        self.gzip = gzip.compress(identity, compresslevel=6, mtime=0)
+        self.etag = '"' + hashlib.blake2b(identity, digest_size=8).hexdigest() + '"'
+
+
+class ExpositionCache:
+    """
+    按快照代数缓存渲染结果
+    多个Prometheus副本、联邦抓取同一快照时只序列化一次；
+    序列没有变化的快照不递增代数，时间戳和其他自身指标的变化最多延迟 EXPOSITION_MAX_AGE 秒体现
+    """
+
+    def __init__(self, registry: CollectorRegistry = REGISTRY):
+        self.registry = registry
+        self._rendered: Optional[RenderedExposition] = None
+        self._lock = asyncio.Lock()
+
+    def _render(self, generation: int) -> RenderedExposition:
+        return RenderedExposition(generation, generate_latest(self.registry))
+
+    @staticmethod
+    def _is_fresh(rendered: Optional[RenderedExposition], generation: int) -> bool:
+        return (
+            rendered is not None
+            and rendered.generation == generation
+            and time.monotonic() - rendered.rendered_at < settings.EXPOSITION_MAX_AGE
+        )
+
+    async def get(self) -> RenderedExposition:
+        """获取当前快照的渲染结果，快照序列变化或渲染结果过期后首次调用时重新渲染"""
+        generation = get_snapshot_generation()
+        rendered = self._rendered
+        if self._is_fresh(rendered, generation):
+            return rendered
+
+        async with self._lock:
+            rendered = self._rendered
+            if not self._is_fresh(rendered, generation):
+                # 渲染和压缩较耗CPU，放到线程中执行避免阻塞事件循环
+                rendered = await asyncio.to_thread(self._render, generation)
+                self._rendered = rendered
+        return rendered
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """根据Accept-Encoding判断客户端是否接受gzip"""
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() not in ('gzip', '*'):
+            continue
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """判断If-None-Match是否命中当前ETag"""
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+_exposition_cache: Optional[ExpositionCache] = None
+
+
+def get_exposition_cache() -> ExpositionCache:
+    """获取全局输出缓存"""
+    global _exposition_cache
+    if _exposition_cache is None:
+        _exposition_cache = ExpositionCache()
+    return _exposition_cache
@@ -0,0 +1,205 @@
+"""
+实例清单内存索引
+各表在内存中保存一份镜像，按 updatetime 水位增量同步，
+采集热路径只读内存索引，不再访问数据库；
+同步使用异步会话，慢数据库不会阻塞事件循环
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.settings import settings
+from models.database import AsyncSessionLocal
+from models.instance import AliyunAccount, InstanceList, InstanceNodeId, InstanceUsers
+
+
+logger = logging.getLogger(__name__)
+
+
+class TableMirror:
+    """
+    单表内存镜像
+    增量同步只拉取 updatetime >= 水位 的行（取等号避免同一秒内的更新被漏掉），
+    再用 COUNT(*)/MAX(id) 检查是否有删除，不一致时全量重载该表
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = [column.key for column in model.__table__.columns]
+        self.rows: Dict[int, Any] = {}
+        self.row_values: Dict[int, Tuple] = {}  # 行内容快照，用于判断行是否真正变化
+        self.watermark: Optional[datetime] = None
+        self.version = 0  # 每次内容变化递增
+
+    def _values(self, row) -> Tuple:
+        return tuple(getattr(row, column) for column in self.columns)
+
+    async def full_load(self, db: AsyncSession):
+        """全量加载"""
+        result = await db.execute(
+            select(self.model).execution_options(populate_existing=True)
+        )
+        rows = result.scalars().all()
+        self.rows = {row.id: row for row in rows}
+        self.row_values = {row.id: self._values(row) for row in rows}
+        self.watermark = max((row.updatetime for row in rows if row.updatetime), default=None)
+        self.version += 1
+
+    async def sync(self, db: AsyncSession) -> bool:
+        """增量同步，返回内容是否有变化"""
+        if self.watermark is None:
+            await self.full_load(db)
+            return True
+
+        changed = 0
+        result = await db.execute(
+            select(self.model).where(
+                self.model.updatetime >= self.watermark
+            ).execution_options(populate_existing=True)
+        )
+        for row in result.scalars().all():
+            values = self._values(row)
+            if self.row_values.get(row.id) != values:
+                self.rows[row.id] = row
+                self.row_values[row.id] = values
+                changed += 1
+            if row.updatetime and row.updatetime > self.watermark:
+                self.watermark = row.updatetime
+
+        # 删除不会更新 updatetime，用行数和最大ID发现
+        result = await db.execute(select(func.count(self.model.id), func.max(self.model.id)))
+        count, max_id = result.one()
+        if count != len(self.rows) or (max_id or 0) != max(self.rows, default=0):
+            logger.info(f"{self.model.__tablename__} 行数或最大ID不一致，全量重载")
+            await self.full_load(db)
+            return True
+
+        if changed:
+            logger.debug(f"{self.model.__tablename__} 增量同步 {changed} 行")
+            self.version += 1
+        return changed > 0
+
+
+class InventoryIndex:
+    """
+    实例清单索引
+    instances: 启用的实例（ins_status == 1）
+    nodes_by_ins: {ins_id: PolarDB节点列表}
+    accounts_by_uid: {aliyun_uid: 启用的阿里云账号}
+    max_connections: {(ins_id, username): max_user_connections}
+    """
+
+    def __init__(self):
+        self.instance_table = TableMirror(InstanceList)
+        self.node_table = TableMirror(InstanceNodeId)
+        self.account_table = TableMirror(AliyunAccount)
+        self.user_table = TableMirror(InstanceUsers)
+
+        self.instances: List[InstanceList] = []
+        self.instances_by_id: Dict[str, InstanceList] = {}
+        self.nodes_by_ins: Dict[str, List[InstanceNodeId]] = {}
+        self.accounts_by_uid: Dict[str, AliyunAccount] = {}
+        self.max_connections: Dict[Tuple[str, str], int] = {}
+        self.loaded_at: float = 0
+        self.full_loaded_at: float = 0
+        # 同一时间只有一个协程同步，避免并发同步交错修改镜像
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def users_version(self) -> int:
+        """instance_users 镜像版本，用于判断最大连接数是否需要重新发布"""
+        return self.user_table.version
+
+    def is_stale(self) -> bool:
+        """检查索引是否需要同步"""
+        return time.time() - self.loaded_at >= settings.INVENTORY_REFRESH_TTL
+
+    def invalidate(self):
+        """标记索引过期，下次使用前全量重载"""
+        self.loaded_at = 0
+        self.full_loaded_at = 0
+
+    async def refresh(self):
+        """同步各表镜像，有变化的部分重建索引"""
+        start_time = time.time()
+        full_reload = start_time - self.full_loaded_at >= settings.INVENTORY_FULL_RELOAD_INTERVAL
+
+        tables = (self.instance_table, self.node_table, self.account_table, self.user_table)
+        async with AsyncSessionLocal() as db:
+            if full_reload:
+                for table in tables:
+                    await table.full_load(db)
+                changed = {table: True for table in tables}
+                self.full_loaded_at = start_time
+            else:
+                changed = {table: await table.sync(db) for table in tables}
+
+        if changed[self.instance_table]:
+            instances = [row for row in self.instance_table.rows.values() if row.ins_status == 1]
+            self.instances = instances
+            self.instances_by_id = {instance.ins_id: instance for instance in instances}
+
+        if changed[self.node_table]:
+            nodes_by_ins: Dict[str, List[InstanceNodeId]] = defaultdict(list)
+            for node in self.node_table.rows.values():
+                nodes_by_ins[node.ins_id].append(node)
+            self.nodes_by_ins = dict(nodes_by_ins)
+
+        if changed[self.account_table]:
+            self.accounts_by_uid = {
+                account.aliyun_uid: account
+                for account in self.account_table.rows.values()
+                if account.status == 1
+            }
+
+        if changed[self.user_table]:
+            self.max_connections = {
+                (user.ins_id, user.username): user.max_user_connections
+                for user in self.user_table.rows.values()
+            }
+
+        self.loaded_at = time.time()
+        if any(changed.values()):
+            logger.info(
+                f"实例清单已{'全量加载' if full_reload else '增量同步'}: 实例 {len(self.instances)} 个, "
+                f"节点 {len(self.node_table.rows)} 个, 账号 {len(self.accounts_by_uid)} 个, "
+                f"用户 {len(self.max_connections)} 个, 耗时 {self.loaded_at - start_time:.3f} 秒"
+            )
+
+    async def refresh_if_stale(self):
+        """索引过期时同步，并发调用只同步一次"""
+        if not self.is_stale():
+            return
+        async with self._refresh_lock:
+            # 等锁期间其他协程可能已完成同步
+            if self.is_stale():
+                await self.refresh()
+
+    def get_instance(self, ins_id: str) -> Optional[InstanceList]:
+        """获取启用的实例"""
+        return self.instances_by_id.get(ins_id)
+
+    def get_nodes(self, ins_id: str) -> List[InstanceNodeId]:
+        """获取实例的PolarDB节点"""
+        return self.nodes_by_ins.get(ins_id, [])
+
+    def get_account(self, aliyun_uid: str) -> Optional[AliyunAccount]:
+        """获取启用的阿里云账号"""
+        return self.accounts_by_uid.get(aliyun_uid)
+
+
+_inventory: Optional[InventoryIndex] = None
+
+
+def get_inventory() -> InventoryIndex:
+    """获取全局实例清单索引"""
+    global _inventory
+    if _inventory is None:
+        _inventory = InventoryIndex()
+    return _inventory
@@ -2,165 +2,299 @@
 import asyncio
 import logging
 import time
-from typing import Dict, List, Tuple, Optional
-from prometheus_client import Gauge
-from sqlalchemy.orm import Session
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
-from models.instance import InstanceList, InstanceUsers
+from services.base_handler import SessionTarget
 from services.das_client import DASClient
+from services.inventory import get_inventory
+from services.sharding import get_shard_selector
+from services.singleflight import SingleFlight
+from services.snapshot_diff import SeriesChanges, diff_samples, diff_target_sessions, diff_utilization
+from services.session_snapshot import (
+    MetricsSnapshot,
+    TargetSessions,
+    get_or_create_snapshot_collector,
+    get_snapshot,
+    publish_snapshot,
+    subset_snapshot,
+    with_utilization
+)
 from config.settings import settings
 
 
 logger = logging.getLogger(__name__)
 
-# 全局指标实例，避免重复注册
-_db_user_session_count: Optional[Gauge] = None
-_db_max_user_connections: Optional[Gauge] = None
-_metrics_collector_instance: Optional['MetricsCollector'] = None
-
+# 完整采集的合并范围
+ALL_SCOPE = ('all',)
 
-def get_or_create_gauge() -> Tuple[Gauge, Gauge]:
-    """获取或创建Gauge指标实例"""
-    global _db_user_session_count, _db_max_user_connections
-    
-    if _db_user_session_count is None:
-        _db_user_session_count = Gauge(
-            'db_user_session_count',
-            '数据库用户会话数',
-            ['ins_id', 'ins_name', 'ins_type', 'aliyun_uid', 'db_user', 'node_id', 'node_type']
-        )
-    
-    if _db_max_user_connections is None:
-        _db_max_user_connections = Gauge(
-            'db_max_user_connections',
-            '用户最大连接数',
-            ['ins_id', 'db_user']
-        )
-    
-    return _db_user_session_count, _db_max_user_connections
+# 全局收集器实例
+_metrics_collector_instance: Optional['MetricsCollector'] = None
 
 
-def get_metrics_collector(db: Session) -> 'MetricsCollector':
+def get_metrics_collector() -> 'MetricsCollector':
     """获取单例MetricsCollector实例"""
     global _metrics_collector_instance
     if _metrics_collector_instance is None:
-        _metrics_collector_instance = MetricsCollector(db)
-    else:
-        # 更新数据库会话
-        _metrics_collector_instance.db = db
-        _metrics_collector_instance.das_client = DASClient(db_session=db)
+        _metrics_collector_instance = MetricsCollector()
+    return _metrics_collector_instance
+
+
+def peek_metrics_collector() -> Optional['MetricsCollector']:
+    """获取已创建的MetricsCollector实例，不存在时不创建"""
     return _metrics_collector_instance
 
 
 class MetricsCollector:
-    """指标收集器"""
+    """
+    指标收集器
+    采集结果写入不可变快照并整体替换，由 SnapshotCollector 在抓取时读取
+    """
     
-    def __init__(self, db: Session):
-        self.db = db
-        self.das_client = DASClient(db_session=db)
-        self.db_user_session_count, self.db_max_user_connections = get_or_create_gauge()
+    def __init__(self):
+        # 实例清单通过异步会话读取，收集器不持有数据库会话，DAS客户端和凭据缓存跨请求复用
+        self.das_client = DASClient()
+        get_or_create_snapshot_collector()
+        self.shard_selector = get_shard_selector()
+        self.inventory = get_inventory()
+        # 定时任务、/metrics 和 /refresh 的并发采集合并执行
+        self.flights = SingleFlight()
         
-        # 缓存
-        self.session_count_cache: Dict[Tuple, float] = {}
+        # 缓存时间，快照本身即为缓存
         self.session_count_cache_time: float = 0
-        self.max_connections_cache: Dict[Tuple, int] = {}
         self.max_connections_cache_time: float = 0
+        self.max_connections_version: int = -1
         
-        # 并发配置
-        self.max_concurrent_instances = getattr(settings, 'MAX_CONCURRENT_INSTANCES', 5)
+        # 最近一次完成 collect_all_metrics 的时间
+        self.last_collection_time: float = 0
         
     def _is_cache_valid(self, cache_time: float, ttl: int) -> bool:
         """检查缓存是否有效"""
         return time.time() - cache_time < ttl
     
-    async def _collect_instance_session(self, instance: InstanceList) -> List[Dict]:
-        """收集单个实例的会话数据"""
-        try:
-            return await self.das_client.get_session_data_for_instance(instance)
-        except Exception as e:
-            logger.error(f"收集实例 {instance.ins_id} 会话数据失败: {e}")
-            return []
+    def _is_last_good_valid(self, collected_at: float) -> bool:
+        """采集失败时保留的最后一次成功结果是否仍可使用"""
+        return settings.LAST_GOOD_MAX_AGE <= 0 or self._is_cache_valid(collected_at, settings.LAST_GOOD_MAX_AGE)
+    
+    def _publish(self, snapshot: MetricsSnapshot, changes: SeriesChanges, ins_ids: Optional[Set[str]] = None):
+        """
+        发布快照并记录序列变化
+        有序列或各用户会话数变化时重新计算会话利用率（ins_ids 不为None时只计算这些实例）；
+        没有变化时只更新时间戳，预渲染的指标输出继续有效
+        """
+        if changes or changes.utilization_inputs:
+            utilization = with_utilization(snapshot, self.inventory.max_connections, ins_ids).utilization
+            snapshot = snapshot.replace(utilization=diff_utilization(snapshot.utilization, utilization, changes))
+        publish_snapshot(snapshot, changed=bool(changes))
+        changes.record()
     
     async def collect_session_count_metrics(self):
-        """收集会话数指标（并行采集）"""
-        current_time = time.time()
-        
+        """收集会话数指标（流水线采集）"""
         # 检查缓存是否有效
         if self._is_cache_valid(self.session_count_cache_time, settings.SESSION_COUNT_CACHE_TTL):
             logger.debug("使用会话数指标缓存")
-            for labels, value in self.session_count_cache.items():
-                self.db_user_session_count.labels(**dict(labels)).set(value)
             return
         
         logger.info("开始收集会话数指标")
         
-        # 清空当前指标
-        self.db_user_session_count.clear()
-        
-        # 查询所有启用的实例
-        instances = self.db.query(InstanceList).filter(InstanceList.ins_status == 1).all()
+        # 从实例清单索引获取启用的实例，只保留本副本分片负责的部分
+        await self.inventory.refresh_if_stale()
+        instances = self.shard_selector.filter_instances(self.inventory.instances)
         
         if not instances:
             logger.info("没有启用的实例")
-            return
         
-        # 使用信号量限制并发数
-        semaphore = asyncio.Semaphore(self.max_concurrent_instances)
-        
-        async def collect_with_semaphore(instance: InstanceList):
-            async with semaphore:
-                return await self._collect_instance_session(instance)
-        
-        # 并行收集所有实例
-        tasks = [collect_with_semaphore(instance) for instance in instances]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 处理结果
-        new_cache: Dict[Tuple, float] = {}
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error(f"收集实例会话异常: {result}")
-                continue
-            
-            for session_data_item in result:
-                labels = session_data_item['labels']
-                value = session_data_item['session_count']
-                self.db_user_session_count.labels(**labels).set(value)
-                new_cache[tuple(sorted(labels.items()))] = value
+        # 两阶段流水线：先为所有目标提交任务，再统一轮询结果，超出时间预算的目标顺延到下一轮
+        targets = self.das_client.get_targets(instances)
+        target_keys = {target.key for target in targets}
+        self.das_client.pipeline.retain(target_keys)
+        deadline = time.monotonic() + settings.CYCLE_DEADLINE if settings.CYCLE_DEADLINE > 0 else None
+        try:
+            results = await self._collect_sessions(targets, deadline=deadline)
+        except Exception as e:
+            logger.error(f"收集会话数据失败: {e}")
+            results = {}
+        self.das_client.pipeline.report_poll_savings()
+        # 快照时间取采集完成的时间，不含提交和轮询前的等待
+        current_time = time.time()
         
-        self.session_count_cache = new_cache
+        # 一次引用替换发布新快照，顺延、失败或熔断的目标保留最后一次成功的结果
+        snapshot = get_snapshot()
+        changes = SeriesChanges()
+        sessions = {}
+        for key, value in snapshot.sessions.items():
+            if key in target_keys and self._is_last_good_valid(value.collected_at):
+                sessions[key] = value
+            else:
+                changes.removed += value.series_count()
+        for key, target_sessions in results.items():
+            sessions[key] = diff_target_sessions(sessions.get(key), target_sessions, changes)
+        self._publish(snapshot.replace(sessions=sessions, session_timestamp=current_time), changes)
         self.session_count_cache_time = current_time
         
-        logger.info(f"会话数指标收集完成，共 {len(new_cache)} 条记录")
+        series_count = sum(len(item.samples) for item in sessions.values())
+        logger.info(
+            f"会话数指标收集完成，共 {series_count} 条记录，"
+            f"序列新增 {changes.added} 条、变化 {changes.changed} 条、删除 {changes.removed} 条"
+        )
     
     async def collect_max_connections_metrics(self):
-        """收集最大连接数指标"""
+        """收集最大连接数指标（来自实例清单索引中的 instance_users 镜像）"""
         current_time = time.time()
         
-        if self._is_cache_valid(self.max_connections_cache_time, settings.MAX_USER_CONNECTIONS_CACHE_TTL):
+        await self.inventory.refresh_if_stale()
+        users_version = self.inventory.users_version
+        if (users_version == self.max_connections_version
+                and self._is_cache_valid(self.max_connections_cache_time, settings.MAX_USER_CONNECTIONS_CACHE_TTL)):
             logger.debug("使用最大连接数指标缓存")
-            for labels, value in self.max_connections_cache.items():
-                self.db_max_user_connections.labels(**dict(labels)).set(value)
             return
         
         logger.info("开始收集最大连接数指标")
         
-        self.db_max_user_connections.clear()
-        users = self.db.query(InstanceUsers).all()
-        
-        new_cache: Dict[Tuple, int] = {}
-        for user in users:
-            labels = {'ins_id': user.ins_id, 'db_user': user.username}
-            value = user.max_user_connections
-            self.db_max_user_connections.labels(**labels).set(value)
-            new_cache[tuple(sorted(labels.items()))] = value
+        snapshot = get_snapshot()
+        changes = SeriesChanges()
+        max_connections = diff_samples(snapshot.max_connections, tuple(
+            ((ins_id, username), value)
+            for (ins_id, username), value in self.inventory.max_connections.items()
+            if self.shard_selector.owns(ins_id)
+        ), changes)
         
-        self.max_connections_cache = new_cache
+        # 上限变化后重新计算会话利用率
+        self._publish(
+            snapshot.replace(max_connections=max_connections, max_connections_timestamp=current_time),
+            changes
+        )
         self.max_connections_cache_time = current_time
+        self.max_connections_version = users_version
+        
+        logger.info(f"最大连接数指标收集完成，共 {len(max_connections)} 条记录")
+    
+    async def probe(self, ins_id: str, node_id: Optional[str] = None) -> Optional[MetricsSnapshot]:
+        """
+        探测单个实例（或其单个节点）
+        缓存期内的目标直接复用快照中的结果，其余目标立即采集并合并回全局快照；
+        实例不存在或未启用时返回None
+        """
+        await self.inventory.refresh_if_stale()
+        instance = self.inventory.get_instance(ins_id)
+        if not instance:
+            return None
+        
+        targets = self.das_client.get_targets([instance])
+        if node_id:
+            targets = [target for target in targets if target.node_id == node_id]
+        
+        current_time = time.time()
+        snapshot = get_snapshot()
+        missing = [
+            target for target in targets
+            if target.key not in snapshot.sessions
+            or not self._is_cache_valid(
+                snapshot.sessions[target.key].collected_at, settings.SESSION_COUNT_CACHE_TTL
+            )
+        ]
+        
+        if missing:
+            logger.info(f"探测实例 {ins_id}，采集 {len(missing)} 个目标")
+            # 同一目标的并发探测合并为一次采集
+            flight_key = ('probe',) + tuple(sorted(target.key for target in missing))
+            await self.flights.do(flight_key, lambda: self.collect_targets(missing))
+            snapshot = get_snapshot()
+        
+        return subset_snapshot(snapshot, [target.key for target in targets])
+    
+    async def _collect_sessions(
+        self,
+        targets: List[SessionTarget],
+        on_result: Optional[Callable[[Tuple[str, str], TargetSessions], None]] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[Tuple[str, str], TargetSessions]:
+        """
+        采集会话数据的唯一入口，按目标合并并发采集
+        调度批次、整轮采集、/refresh 和 /probe 请求的目标已在采集中时加入进行中的任务，
+        同一目标同时只有一个DAS任务，也只有一个流水线在处理它的顺延记录；
+        on_result 只对本次新发起采集的目标回调
+        """
+        by_key = {('target',) + target.key: target for target in targets}
+
+        async def collect(keys: List[Tuple[str, ...]]) -> Dict[Tuple[str, ...], TargetSessions]:
+            results = await self.das_client.collect_session_data(
+                [by_key[key] for key in keys], on_result=on_result, deadline=deadline
+            )
+            return {('target',) + key: value for key, value in results.items()}
+
+        results = await self.flights.do_each(list(by_key), collect)
+        return {key[1:]: value for key, value in results.items()}
+    
+    def _merge(self, key: Tuple[str, str], target_sessions: TargetSessions):
+        """把单个目标的采集结果合并到当前快照"""
+        # 采集期间快照可能已被替换，合并到最新的快照上
+        snapshot = get_snapshot()
+        changes = SeriesChanges()
+        sessions = dict(snapshot.sessions)
+        sessions[key] = diff_target_sessions(sessions.get(key), target_sessions, changes)
+        self._publish(
+            snapshot.replace(sessions=sessions, session_timestamp=target_sessions.collected_at),
+            changes,
+            {key[0]}
+        )
+    
+    async def collect_targets(self, targets: List[SessionTarget], deadline: Optional[float] = None) -> int:
+        """
+        采集指定目标，每个目标完成时立即合并到当前快照
+        deadline: 截止时间（time.monotonic），超出的目标顺延到下一次采集
+        返回成功采集的目标数
+        """
+        results = await self._collect_sessions(targets, on_result=self._merge, deadline=deadline)
+        # 加入的采集由发起方处理结果，整轮采集要到全部完成后才发布，这里先合并
+        snapshot = get_snapshot()
+        for key, target_sessions in results.items():
+            current = snapshot.sessions.get(key)
+            if current is None or current.collected_at != target_sessions.collected_at:
+                self._merge(key, target_sessions)
+        return len(results)
+    
+    def retain_targets(self, keys: Set[Tuple[str, str]]):
+        """
+        从快照中移除不再采集的目标（实例停用、节点删除或分片迁出），
+        以及超过 LAST_GOOD_MAX_AGE 仍未采集成功的目标
+        """
+        self.das_client.pipeline.retain(keys)
+        snapshot = get_snapshot()
+        changes = SeriesChanges()
+        sessions = {}
+        for key, value in snapshot.sessions.items():
+            if key in keys and self._is_last_good_valid(value.collected_at):
+                sessions[key] = value
+            else:
+                changes.removed += value.series_count()
+        removed = len(snapshot.sessions) - len(sessions)
+        if removed:
+            self._publish(snapshot.replace(sessions=sessions), changes)
+            logger.info(f"从快照中移除 {removed} 个不再采集或结果过期的目标")
+    
+    async def refresh_instance(self, ins_id: str) -> Optional[int]:
+        """
+        重新采集单个实例并合并回当前快照，忽略缓存
+        返回成功采集的目标数，实例不存在或未启用时返回None
+        """
+        await self.inventory.refresh_if_stale()
+        instance = self.inventory.get_instance(ins_id)
+        if not instance:
+            return None
         
-        logger.info(f"最大连接数指标收集完成，共 {len(new_cache)} 条记录")
+        targets = self.das_client.get_targets([instance])
+        logger.info(f"手动刷新实例 {ins_id}，采集 {len(targets)} 个目标")
+        return await self.flights.do(('instance', ins_id), lambda: self.collect_targets(targets))
+    
+    def trigger_collection(self) -> asyncio.Task:
+        """在后台启动一轮完整采集，已有进行中的采集时不重复启动"""
+        return self.flights.start(ALL_SCOPE, self._collect_all_metrics)
     
     async def collect_all_metrics(self):
+        """收集所有指标，并发调用加入同一轮采集"""
+        await self.flights.do(ALL_SCOPE, self._collect_all_metrics)
+    
+    async def _collect_all_metrics(self):
         """收集所有指标"""
         logger.info("开始收集所有指标")
         start_time = time.time()
@@ -172,7 +306,8 @@ class MetricsCollector:
                 self.collect_max_connections_metrics()
             )
             
-            elapsed = time.time() - start_time
+            self.last_collection_time = time.time()
+            elapsed = self.last_collection_time - start_time
             logger.info(f"所有指标收集完成，耗时 {elapsed:.2f} 秒")
         except Exception as e:
             logger.error(f"收集指标时发生错误: {e}")
@@ -183,4 +318,9 @@ class MetricsCollector:
         logger.info("手动触发指标刷新")
         self.session_count_cache_time = 0
         self.max_connections_cache_time = 0
-        await self.collect_all_metrics()
\ No newline at end of file
+        self.inventory.invalidate()
+        await self.collect_all_metrics()
+        
+        # 加入的采集可能在缓存失效前就判断缓存有效而跳过了会话采集，此时再采集一次
+        if self.session_count_cache_time == 0:
+            await self.collect_all_metrics()
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+DAS异步任务轮询统计
+按采集目标学习任务完成耗时，用于决定首次轮询时间和后续退避间隔
+"""
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+
+
+class PollLatencyTracker:
+    """
+    按目标 (ins_id, node_id) 统计任务完成耗时的EWMA
+    实际完成时间只知道落在"最后一次未完成轮询"和"完成轮询"之间，取区间中点作为样本
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._latency: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def expected_latency(self, key: Tuple[str, str]) -> Optional[float]:
+        """获取目标的预期完成耗时，没有历史数据时返回None"""
+        return self._latency.get(key)
+
+    def record(self, key: Tuple[str, str], lower: float, upper: float):
+        """
+        记录一次完成耗时
+        lower: 最后一次未完成轮询距提交的秒数（首次轮询即完成时为0）
+        upper: 完成轮询距提交的秒数
+        """
+        sample = (lower + upper) / 2
+        with self._lock:
+            previous = self._latency.get(key)
+            if previous is None:
+                self._latency[key] = sample
+            else:
+                self._latency[key] = previous + self.alpha * (sample - previous)
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """有统计数据的目标"""
+        with self._lock:
+            return list(self._latency)
+
+    def forget(self, key: Tuple[str, str]):
+        """删除不再采集的目标的统计"""
+        with self._lock:
+            self._latency.pop(key, None)
+
+    def first_poll_delay(self, key: Tuple[str, str]) -> float:
+        """首次轮询延迟：有历史数据时取预期耗时，否则取 POLL_INTERVAL"""
+        expected = self.expected_latency(key)
+        delay = expected if expected is not None else settings.POLL_INTERVAL
+        return with_jitter(delay)
+
+    @staticmethod
+    def next_interval(attempts: int) -> float:
+        """第 attempts 次未完成后的退避间隔"""
+        interval = settings.POLL_INTERVAL * (settings.POLL_BACKOFF_FACTOR ** max(attempts - 1, 0))
+        return with_jitter(min(interval, settings.POLL_MAX_INTERVAL))
+
+    @staticmethod
+    def fixed_schedule_polls(elapsed: Optional[float]) -> int:
+        """
+        按固定间隔轮询（提交后立即轮询，之后每 POLL_INTERVAL 一次）所需的轮询次数
+        elapsed 为None表示任务未完成，固定调度会用满 POLL_MAX_ATTEMPTS 次
+        """
+        if elapsed is None:
+            return settings.POLL_MAX_ATTEMPTS
+        return min(int(elapsed / settings.POLL_INTERVAL) + 1, settings.POLL_MAX_ATTEMPTS)
+
+
+def with_jitter(delay: float) -> float:
+    """按 POLL_JITTER 比例加入随机抖动，避免大量目标同时轮询"""
+    jitter = settings.POLL_JITTER
+    return max(delay * random.uniform(1 - jitter, 1 + jitter), 0.0)
+
+
+# 全局统计实例，DASClient重建时保留学习结果
+_poll_tracker: Optional[PollLatencyTracker] = None
+
+
+def get_poll_tracker() -> PollLatencyTracker:
+    """获取全局轮询统计实例"""
+    global _poll_tracker
+    if _poll_tracker is None:
+        _poll_tracker = PollLatencyTracker(settings.POLL_EWMA_ALPHA)
+    return _poll_tracker
@@ -0,0 +1,112 @@
+"""
+DAS API限流器
+按阿里云账号和DAS endpoint维度共享的进程级令牌桶，
+触发DAS流控后按AIMD调整速率：乘性降低，之后每个调整间隔加性恢复到配置的速率
+"""
+import threading
+import time
+from typing import Dict, Tuple
+
+from config.settings import settings
+from services.exporter_metrics import das_api_rate_limit
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+    取令牌时只在短暂的临界区内预扣令牌并计算等待时间，
+    等待发生在锁外，等待者之间互不阻塞且按到达顺序获得令牌
+    """
+
+    def __init__(self, rate: float, burst: float, gauge=None):
+        self.max_rate = rate  # 配置的速率上限
+        self.rate = rate  # 当前每秒补充的令牌数
+        self.burst = max(burst, 1.0)  # 桶容量，即允许的突发调用数
+        self.gauge = gauge  # 导出当前速率的指标
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._last_adjust = 0.0
+        self._lock = threading.Lock()
+        self._export()
+
+    def _refill(self, now: float):
+        """按当前速率补充令牌（调用方持有锁）"""
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _export(self):
+        if self.gauge is not None:
+            self.gauge.set(self.rate)
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        预扣令牌，返回需要等待的秒数
+        令牌不足时余额为负，后续调用者顺延等待
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self, tokens: float = 1.0):
+        """归还预扣但未使用的令牌"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def on_throttled(self) -> bool:
+        """
+        触发流控：速率乘性降低并清空剩余令牌，返回是否调整了速率
+        同一调整间隔内的多个流控错误来自同一批调用，只降低一次
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            if now - self._last_adjust < settings.DAS_API_AIMD_INTERVAL:
+                return False
+            self.rate = max(self.rate * settings.DAS_API_AIMD_DECREASE, settings.DAS_API_RATE_MIN)
+            self._last_adjust = now
+        self._export()
+        return True
+
+    def on_success(self):
+        """调用成功：速率低于上限时每个调整间隔加性恢复一次"""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_adjust < settings.DAS_API_AIMD_INTERVAL:
+                return
+            self._refill(now)
+            self.rate = min(self.rate + settings.DAS_API_AIMD_INCREASE, self.max_rate)
+            self._last_adjust = now
+        self._export()
+
+
+# 全局限流器注册表，键为 (aliyun_uid, endpoint)
+_limiters: Dict[Tuple[str, str], TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(aliyun_uid: str, endpoint: str = '') -> TokenBucket:
+    """
+    获取账号对应的全局限流器
+    同一账号同一endpoint的所有处理器、所有DASClient实例共享同一个令牌桶
+    """
+    key = (aliyun_uid, endpoint)
+    limiter = _limiters.get(key)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = TokenBucket(
+                rate=settings.DAS_API_RATE_LIMIT,
+                burst=settings.DAS_API_RATE_BURST,
+                gauge=das_api_rate_limit.labels(aliyun_uid=aliyun_uid, endpoint=endpoint)
+            )
+            _limiters[key] = limiter
+    return limiter
@@ -0,0 +1,150 @@
+"""
+会话变动统计
+对比同一目标相邻两次采集中各用户的 ThreadIdList，得到期间新建和关闭的会话数，
+以累计值导出为 db_user_sessions_opened_total / db_user_sessions_closed_total。
+每个目标的全部线程ID存为一个有序的 numpy int64 数组，并行存放所属用户的下标，
+每个ID占12字节；一次 searchsorted 求出整个目标与上次采集的共同线程ID，再用 bincount 按用户计数，
+不按用户逐个调用。单个目标的线程ID数超过 SESSION_CHURN_MAX_THREADS 时不再统计该目标，内存有上限
+"""
+import itertools
+import logging
+from typing import Container, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from services.session_snapshot import Sample
+
+
+logger = logging.getLogger(__name__)
+
+
+class TargetThreads:
+    """
+    单个目标上一次采集的线程ID和各用户累计新建/关闭会话数
+    users: 会话序列label值元组，thread_ids: 有序线程ID，user_index: 各线程ID所属用户在 users 中的下标，
+    lengths/opened/closed: 按 users 顺序的线程ID数和累计新建/关闭会话数
+    """
+
+    __slots__ = ('users', 'thread_ids', 'user_index', 'lengths', 'opened', 'closed')
+
+    def __init__(
+        self,
+        users: List[Tuple[str, ...]],
+        thread_ids: np.ndarray,
+        user_index: np.ndarray,
+        lengths: np.ndarray,
+        opened: np.ndarray,
+        closed: np.ndarray
+    ):
+        self.users = users
+        self.thread_ids = thread_ids
+        self.user_index = user_index
+        self.lengths = lengths
+        self.opened = opened
+        self.closed = closed
+
+
+class ChurnTracker:
+    """按目标保存上一次采集的线程ID并累计会话变动"""
+
+    def __init__(self):
+        self.targets: Dict[Tuple[str, str], TargetThreads] = {}
+
+    @staticmethod
+    def _common_counts(
+        previous: TargetThreads,
+        thread_ids: np.ndarray,
+        user_index: np.ndarray,
+        remap: np.ndarray,
+        user_count: int
+    ) -> np.ndarray:
+        """本次各用户的线程ID中，上次采集时也属于该用户的个数"""
+        if not len(previous.thread_ids) or not len(thread_ids):
+            return np.zeros(user_count, dtype=np.int64)
+        positions = np.searchsorted(previous.thread_ids, thread_ids)
+        positions[positions == len(previous.thread_ids)] = 0
+        common = (
+            (previous.thread_ids[positions] == thread_ids)
+            & (remap[previous.user_index[positions]] == user_index)
+        )
+        return np.bincount(user_index[common], minlength=user_count)
+
+    def observe(
+        self,
+        key: Tuple[str, str],
+        users: List[Tuple[Tuple[str, ...], Sequence[int]]]
+    ) -> Tuple[Tuple[Sample, ...], Tuple[Sample, ...]]:
+        """
+        记录目标本次采集的各用户线程ID，返回 (累计新建会话数序列, 累计关闭会话数序列)
+        users: [(会话序列label值元组, 该用户的线程ID)]
+        目标首次采集只记录基线；上次存在本次消失的用户记一次全部关闭，之后不再导出
+        """
+        labels = [label_values for label_values, _ in users]
+        lengths = np.array([len(thread_ids) for _, thread_ids in users], dtype=np.int64)
+        total = int(lengths.sum())
+        if total > settings.SESSION_CHURN_MAX_THREADS:
+            if self.targets.pop(key, None) is not None:
+                logger.warning(f"{key} 的线程ID数超过 SESSION_CHURN_MAX_THREADS，停止统计会话变动")
+            return (), ()
+
+        # 所有用户的线程ID一次转换为 int64 数组
+        thread_ids = np.fromiter(
+            itertools.chain.from_iterable(thread_ids for _, thread_ids in users), dtype=np.int64, count=total
+        )
+        user_index = np.repeat(np.arange(len(labels), dtype=np.int32), lengths)
+        order = np.argsort(thread_ids, kind='stable')
+        thread_ids = thread_ids[order]
+        user_index = user_index[order]
+        opened = np.zeros(len(labels), dtype=np.int64)
+        closed = np.zeros(len(labels), dtype=np.int64)
+
+        previous = self.targets.get(key)
+        if previous is not None:
+            # 上次的用户在本次 labels 中的下标，本次不存在为-1
+            positions = {label_values: index for index, label_values in enumerate(labels)}
+            remap = np.array(
+                [positions.get(label_values, -1) for label_values in previous.users], dtype=np.int32
+            )
+            common = self._common_counts(previous, thread_ids, user_index, remap, len(labels))
+
+            # 新出现的用户全部会话都是新建的
+            matched = remap >= 0
+            current = remap[matched]
+            opened[current] = previous.opened[matched]
+            closed[current] = previous.closed[matched] + previous.lengths[matched] - common[current]
+            opened += lengths - common
+
+            # 用户的会话全部关闭，保留一次以导出最后的累计值
+            vanished = ~matched & (previous.lengths > 0)
+            if vanished.any():
+                labels.extend(previous.users[index] for index in np.flatnonzero(vanished))
+                lengths = np.concatenate([lengths, np.zeros(np.count_nonzero(vanished), dtype=np.int64)])
+                opened = np.concatenate([opened, previous.opened[vanished]])
+                closed = np.concatenate([closed, previous.closed[vanished] + previous.lengths[vanished]])
+
+        self.targets[key] = TargetThreads(labels, thread_ids, user_index, lengths, opened, closed)
+        return (
+            tuple(zip(labels, opened.tolist())),
+            tuple(zip(labels, closed.tolist()))
+        )
+
+    def retain(self, keys: Container[Tuple[str, str]]):
+        """丢弃不再采集的目标"""
+        for key in [key for key in self.targets if key not in keys]:
+            del self.targets[key]
+
+    def thread_count(self) -> int:
+        """当前保存的线程ID总数"""
+        return sum(len(target.thread_ids) for target in self.targets.values())
+
+
+_churn_tracker: Optional[ChurnTracker] = None
+
+
+def get_churn_tracker() -> ChurnTracker:
+    """获取全局会话变动统计"""
+    global _churn_tracker
+    if _churn_tracker is None:
+        _churn_tracker = ChurnTracker()
+    return _churn_tracker
@@ -0,0 +1,155 @@
+"""
+GetMySQLAllSessionAsync 响应轻量解析
+SDK会把 SessionList 中的每个会话和 UserStats/ClientStats 中的 ThreadIdList 都转换成Tea模型对象，
+会话多的实例单次响应有数万个会话和线程ID，而导出的指标只用到各维度的 UserList、TotalCount、ActiveCount。
+这里直接读取原始响应体，先剔除 SessionList 和 ThreadIdList 两个大数组再解码，
+只构建导出用到的字段；解析结果的属性名与SDK模型一致，后续处理无需区分两种解析方式
+"""
+import json
+import re
+from typing import Any, Dict, Optional
+
+from alibabacloud_das20200116 import models as das20200116_models
+from alibabacloud_openapi_util.client import Client as OpenApiUtilClient
+from alibabacloud_tea_openapi import models as open_api_models
+
+
+# ThreadIdList 只包含整数
+_THREAD_ID_LIST = re.compile(r'"ThreadIdList"\s*:\s*\[[\d,\s]*\]')
+_SESSION_LIST_START = re.compile(r'"SessionList"\s*:\s*\[')
+
+
+class ParsedStat:
+    """UserStats/ClientStats 中的一项"""
+
+    __slots__ = ('key', 'user_list', 'total_count', 'active_count', 'thread_id_list')
+
+    def __init__(self, item: Dict[str, Any]):
+        self.key = item.get('Key')
+        self.user_list = item.get('UserList') or []
+        self.total_count = item.get('TotalCount')
+        self.active_count = item.get('ActiveCount')
+        self.thread_id_list = item.get('ThreadIdList')
+
+
+class ParsedSessionData:
+    """SessionData 中导出指标用到的字段"""
+
+    __slots__ = ('user_stats', 'client_stats', 'total_session_count', 'active_session_count')
+
+    def __init__(self, session_data: Dict[str, Any]):
+        self.user_stats = [ParsedStat(item) for item in session_data.get('UserStats') or []]
+        self.client_stats = [ParsedStat(item) for item in session_data.get('ClientStats') or []]
+        self.total_session_count = session_data.get('TotalSessionCount')
+        self.active_session_count = session_data.get('ActiveSessionCount')
+
+
+class ParsedData:
+    """响应中的 Data 字段"""
+
+    __slots__ = ('result_id', 'is_finish', 'state', 'fail', 'session_data')
+
+    def __init__(self, data: Dict[str, Any]):
+        self.result_id = data.get('ResultId')
+        self.is_finish = data.get('IsFinish')
+        self.state = data.get('State')
+        self.fail = data.get('Fail')
+        session_data = data.get('SessionData')
+        self.session_data = ParsedSessionData(session_data) if session_data else None
+
+
+class ParsedResponse:
+    """响应体，对应SDK的 GetMySQLAllSessionAsyncResponseBody"""
+
+    __slots__ = ('code', 'message', 'request_id', 'success', 'data')
+
+    def __init__(self, body: Dict[str, Any]):
+        self.code = body.get('Code')
+        self.message = body.get('Message')
+        self.request_id = body.get('RequestId')
+        self.success = body.get('Success')
+        data = body.get('Data')
+        self.data = ParsedData(data) if data else None
+
+
+def _find_array_end(raw: str, start: int) -> int:
+    """
+    查找数组结束的 ']' 位置，start 为 '[' 之后的位置
+    SessionList 的元素是不含嵌套数组的平铺对象，第一个不在字符串内的 ']' 即为数组结束；
+    用 str.count 统计未转义的引号数判断是否在字符串内，整段扫描都在C层完成。
+    含转义反斜杠时无法这样判断，返回-1
+    """
+    end = raw.find(']', start)
+    while end != -1:
+        if raw.find('\\\\', start, end) != -1:
+            return -1
+        if (raw.count('"', start, end) - raw.count('\\"', start, end)) % 2 == 0:
+            return end
+        end = raw.find(']', end + 1)
+    return -1
+
+
+def strip_session_details(raw: str, keep_thread_ids: bool = False) -> str:
+    """剔除响应中的 SessionList 和 ThreadIdList 数组，keep_thread_ids 时保留 ThreadIdList"""
+    match = _SESSION_LIST_START.search(raw)
+    if match:
+        end = _find_array_end(raw, match.end())
+        if end != -1:
+            raw = raw[:match.end()] + raw[end:]
+    if keep_thread_ids:
+        return raw
+    return _THREAD_ID_LIST.sub('"ThreadIdList":[]', raw)
+
+
+def parse_session_response(raw: Optional[str], keep_thread_ids: bool = False) -> Optional[ParsedResponse]:
+    """
+    解析 GetMySQLAllSessionAsync 的原始响应体
+    keep_thread_ids: 保留 ThreadIdList（会话变动统计需要）
+    剔除后的内容不是合法JSON时（响应结构与预期不符）回退为完整解码；
+    响应体为空或不是JSON对象时返回None，与SDK响应没有 body 时一样按调用失败处理
+    """
+    if not raw or not raw.strip():
+        return None
+    try:
+        body = json.loads(strip_session_details(raw, keep_thread_ids))
+    except ValueError:
+        body = json.loads(raw)
+    if not isinstance(body, dict):
+        return None
+    return ParsedResponse(body)
+
+
+def build_raw_call(
+    request: das20200116_models.GetMySQLAllSessionAsyncRequest
+) -> Dict[str, Any]:
+    """
+    构建 call_api 的参数，与SDK的 get_my_sqlall_session_async_with_options 相同，
+    只是响应体按字符串返回，不做JSON解码和模型转换
+    """
+    query = {'InstanceId': request.instance_id}
+    if request.node_id:
+        query['NodeId'] = request.node_id
+    if request.result_id:
+        query['ResultId'] = request.result_id
+    return {
+        'params': open_api_models.Params(
+            action='GetMySQLAllSessionAsync',
+            version='2020-01-16',
+            protocol='HTTPS',
+            pathname='/',
+            method='POST',
+            auth_type='AK',
+            style='RPC',
+            req_body_type='formData',
+            body_type='string'
+        ),
+        'request': open_api_models.OpenApiRequest(query=OpenApiUtilClient.query(query))
+    }
+
+
+def read_raw_body(response: Dict[str, Any]) -> Optional[str]:
+    """call_api 返回值中的响应体字符串"""
+    body = response.get('body')
+    if isinstance(body, bytes):
+        return body.decode('utf-8')
+    return body
@@ -0,0 +1,333 @@
+"""
+两阶段会话采集流水线
+第一阶段为所有目标提交 GetMySQLAllSessionAsync 任务，
+第二阶段由单个轮询调度器按就绪时间轮询所有未完成的结果ID，
+首次轮询推迟到该目标学习到的预期完成时间，之后按指数退避加抖动轮询；
+每个目标完成时立即回调，调用方可以逐个目标发布结果。
+指定时间预算时按优先级提交，来不及提交的目标和预算内未完成的任务顺延到下一轮，
+已提交的任务下一轮继续轮询原结果ID，不重复提交。
+每个目标的成功/失败记入熔断器，熔断中的目标不提交，永久错误直接熔断
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Container, Dict, List, Optional, Set, Tuple
+
+from config.settings import settings
+from services.base_handler import BaseHandler, DeadlineExceeded, SessionTarget
+from services.circuit_breaker import get_breakers
+from services.das_errors import DASAPIError
+from services.exporter_metrics import (
+    das_carried_over_targets,
+    das_poll_calls,
+    das_poll_calls_saved,
+    das_poll_calls_saved_last_cycle,
+    das_targets_breaker_rejected,
+    das_targets_skipped
+)
+from services.poll_stats import get_poll_tracker
+from services.session_churn import get_churn_tracker
+from services.session_snapshot import TargetSessions, get_snapshot
+from services.target_priority import TargetPrioritizer
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingJob:
+    """已提交、等待轮询的异步任务"""
+
+    def __init__(self, target: SessionTarget, handler: BaseHandler, client, result_id: str):
+        self.target = target
+        self.handler = handler
+        self.client = client
+        self.result_id = result_id
+        self.submitted_at = time.monotonic()
+        self.attempts = 0
+        self.last_pending_elapsed = 0.0  # 最后一次未完成轮询距提交的秒数
+
+
+class SessionPipeline:
+    """
+    会话采集流水线
+    整轮采集耗时约为一次DAS任务的完成时间，而不是 目标数/并发数 × 单次耗时
+    """
+
+    def __init__(self, das_client):
+        self.das_client = das_client
+        self.poll_tracker = get_poll_tracker()
+        self.prioritizer = TargetPrioritizer(das_client.inventory, self.poll_tracker)
+        # 顺延到下一轮的目标：值为已提交未完成的任务，未提交的目标为None
+        self.carried: Dict[Tuple[str, str], Optional[PendingJob]] = {}
+        # 导出过顺延次数的目标，不再采集时删除其序列
+        self.skipped_keys: Set[Tuple[str, str]] = set()
+        self.breakers = get_breakers()
+        # 上次汇报以来自适应轮询节省的调用次数，continuous 模式下跨多个批次累加
+        self.poll_calls_saved = 0
+
+    def _carry_over(self, target: SessionTarget, job: Optional[PendingJob]):
+        """记录顺延到下一轮的目标"""
+        self.carried[target.key] = job
+        self.skipped_keys.add(target.key)
+        das_targets_skipped.labels(
+            ins_id=target.instance.ins_id,
+            node_id=target.node_id,
+            stage='poll' if job else 'submit'
+        ).inc()
+
+    def retain(self, keys: Container[Tuple[str, str]]):
+        """丢弃不再采集的目标的顺延记录和顺延次数指标、耗时统计、熔断器和会话变动状态"""
+        for key in [key for key in self.carried if key not in keys]:
+            del self.carried[key]
+        for key in [key for key in self.skipped_keys if key not in keys]:
+            self.skipped_keys.discard(key)
+            for stage in ('submit', 'poll'):
+                try:
+                    das_targets_skipped.remove(*key, stage)
+                except KeyError:
+                    pass
+        for key in self.poll_tracker.keys():
+            if key not in keys:
+                self.poll_tracker.forget(key)
+        das_carried_over_targets.set(len(self.carried))
+        self.breakers.retain(keys)
+        get_churn_tracker().retain(keys)
+
+    def report_poll_savings(self):
+        """把上次汇报以来累计节省的轮询调用次数写入 das_exporter_poll_calls_saved_last_cycle 并清零"""
+        das_poll_calls_saved_last_cycle.set(self.poll_calls_saved)
+        self.poll_calls_saved = 0
+
+    def _resume(self, target: SessionTarget) -> Optional[PendingJob]:
+        """取出上一轮顺延且仍未超时的任务，继续轮询原结果ID"""
+        job = self.carried.pop(target.key, None)
+        if job is None or time.monotonic() - job.submitted_at >= settings.POLL_TIMEOUT:
+            return None
+        job.target = target
+        return job
+
+    async def _submit(self, target: SessionTarget, deadline: Optional[float] = None) -> Optional[PendingJob]:
+        """
+        提交单个目标的采集任务
+        指定时间预算时，预计无法在预算内完成的目标抛出 DeadlineExceeded
+        """
+        handler = self.das_client.get_handler(target.instance)
+        client = handler.client_manager.get_client_for_account(target.instance.aliyun_uid)
+        if not client:
+            logger.error(f"无法获取账号 {target.instance.aliyun_uid} 的DAS客户端")
+            return None
+
+        latest_start = None
+        if deadline is not None:
+            expected = self.poll_tracker.expected_latency(target.key)
+            latest_start = deadline - (expected if expected is not None else settings.POLL_INTERVAL)
+            if time.monotonic() > latest_start:
+                raise DeadlineExceeded()
+
+        result_id = await handler.submit_session_job(client, target, latest_start)
+        if not result_id:
+            return None
+        return PendingJob(target, handler, client, result_id)
+
+    async def _poll_all(
+        self,
+        jobs: List[PendingJob],
+        on_finished: Callable[[PendingJob, Any], None],
+        deadline: Optional[float] = None
+    ) -> List[PendingJob]:
+        """
+        轮询调度器
+        用最小堆维护每个结果ID的下次轮询时间，到期的任务并发轮询，未完成的按退避间隔重新入堆；
+        任务完成（含DAS返回失败状态）时调用 on_finished(job, response_data)；
+        返回下次轮询时间超出时间预算的任务
+        """
+        counter = itertools.count()
+        heap: List[Tuple[float, int, PendingJob]] = []
+        unfinished: List[PendingJob] = []
+        for job in jobs:
+            if job.attempts:
+                # 上一轮顺延的任务已经轮询过，按退避间隔继续
+                first_poll_at = time.monotonic() + self.poll_tracker.next_interval(job.attempts)
+            else:
+                first_poll_at = job.submitted_at + self.poll_tracker.first_poll_delay(job.target.key)
+            heapq.heappush(heap, (first_poll_at, next(counter), job))
+
+        in_flight: Dict[asyncio.Task, PendingJob] = {}
+        poll_calls = 0
+        fixed_schedule_calls = 0
+
+        try:
+            while heap or in_flight:
+                now = time.monotonic()
+                while heap and heap[0][0] <= now:
+                    _, _, job = heapq.heappop(heap)
+                    job.attempts += 1
+                    task = asyncio.create_task(
+                        job.handler.poll_session_job(job.client, job.target, job.result_id, deadline)
+                    )
+                    in_flight[task] = job
+
+                timeout = max(heap[0][0] - now, 0) if heap else None
+                if not in_flight:
+                    await asyncio.sleep(timeout)
+                    continue
+
+                done, _ = await asyncio.wait(
+                    in_flight.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    job = in_flight.pop(task)
+                    elapsed = time.monotonic() - job.submitted_at
+                    try:
+                        response_data = task.result()
+                    except DeadlineExceeded:
+                        # 限流等待超出时间预算，本次轮询未发出
+                        job.attempts -= 1
+                        unfinished.append(job)
+                        continue
+                    except DASAPIError as e:
+                        logger.error(f"轮询 {job.target} 的结果 {job.result_id} 失败: {e}")
+                        self.breakers.record_failure(job.target, permanent=True)
+                        poll_calls += job.attempts
+                        fixed_schedule_calls += min(job.attempts, settings.POLL_MAX_ATTEMPTS)
+                        continue
+                    except Exception as e:
+                        logger.error(f"轮询结果 {job.result_id} 异常: {str(e)}")
+                        response_data = None
+
+                    if not response_data:
+                        logger.warning(f"无法获取 {job.target} 的轮询结果")
+                        self.breakers.record_failure(job.target)
+                        poll_calls += job.attempts
+                        fixed_schedule_calls += min(job.attempts, settings.POLL_MAX_ATTEMPTS)
+                        continue
+
+                    if BaseHandler.is_error_response(response_data):
+                        logger.error(
+                            f"轮询 {job.target} 的结果 {job.result_id} 返回错误: "
+                            f"{response_data.code} {response_data.message}"
+                        )
+                        self.breakers.record_failure(job.target)
+                        poll_calls += job.attempts
+                        fixed_schedule_calls += min(job.attempts, settings.POLL_MAX_ATTEMPTS)
+                        continue
+
+                    if response_data.data.is_finish or BaseHandler.is_job_failed(response_data):
+                        logger.debug(f"轮询结果 {job.result_id} 完成 (尝试 {job.attempts} 次)")
+                        self.poll_tracker.record(job.target.key, job.last_pending_elapsed, elapsed)
+                        poll_calls += job.attempts
+                        fixed_schedule_calls += self.poll_tracker.fixed_schedule_polls(elapsed)
+                        if BaseHandler.is_job_failed(response_data):
+                            # 失败的任务不产生结果，快照保留上一次成功的结果
+                            logger.error(f"{job.target} 获取会话数据失败")
+                            self.breakers.record_failure(job.target)
+                            continue
+                        self.breakers.record_success(job.target)
+                        try:
+                            on_finished(job, response_data)
+                        except Exception as e:
+                            logger.error(f"处理 {job.target} 的采集结果异常: {str(e)}")
+                        continue
+
+                    job.last_pending_elapsed = elapsed
+                    if job.attempts >= settings.POLL_MAX_ATTEMPTS or elapsed >= settings.POLL_TIMEOUT:
+                        logger.warning(f"轮询结果 {job.result_id} 超时 (尝试 {job.attempts} 次)")
+                        self.breakers.record_failure(job.target)
+                        poll_calls += job.attempts
+                        fixed_schedule_calls += self.poll_tracker.fixed_schedule_polls(None)
+                        continue
+
+                    next_poll_at = time.monotonic() + self.poll_tracker.next_interval(job.attempts)
+                    if deadline is not None and next_poll_at > deadline:
+                        unfinished.append(job)
+                        continue
+                    heapq.heappush(heap, (next_poll_at, next(counter), job))
+        finally:
+            # 异常退出时不留下脱离调度的轮询任务
+            for task in in_flight:
+                task.cancel()
+
+        saved = fixed_schedule_calls - poll_calls
+        das_poll_calls.inc(poll_calls)
+        das_poll_calls_saved.inc(max(saved, 0))
+        self.poll_calls_saved += saved
+        logger.debug(f"本批轮询调用 {poll_calls} 次，固定间隔轮询预计 {fixed_schedule_calls} 次，节省 {saved} 次")
+        return unfinished
+
+    async def run(
+        self,
+        targets: List[SessionTarget],
+        on_result: Optional[Callable[[Tuple[str, str], TargetSessions], None]] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[Tuple[str, str], TargetSessions]:
+        """
+        执行一轮采集，返回 {(ins_id, node_id): 该目标的会话序列}
+        未能完成的目标不出现在结果中；指定 on_result 时每个目标完成后立即回调；
+        deadline 为本轮的截止时间（time.monotonic），超出的目标顺延到下一轮
+        """
+        start_time = time.monotonic()
+
+        # 按优先级排序，令牌桶按提交顺序放行，重要的目标先提交
+        targets = self.prioritizer.order(targets, get_snapshot(), self.carried)
+
+        # 第一阶段：上一轮已提交的任务直接续轮询，其余目标提交新任务
+        jobs = []
+        to_submit = []
+        rejected = 0
+        for target in targets:
+            job = self._resume(target)
+            if job:
+                jobs.append(job)
+            elif self.breakers.allow(target):
+                to_submit.append(target)
+            else:
+                rejected += 1
+        if rejected:
+            das_targets_breaker_rejected.inc(rejected)
+            logger.debug(f"{rejected} 个目标处于熔断状态，本轮不提交")
+
+        submitted = await asyncio.gather(
+            *[self._submit(target, deadline) for target in to_submit], return_exceptions=True
+        )
+        skipped = 0
+        for target, job in zip(to_submit, submitted):
+            if isinstance(job, DeadlineExceeded):
+                self.breakers.release(target)
+                self._carry_over(target, None)
+                skipped += 1
+            elif isinstance(job, DASAPIError):
+                logger.error(f"提交 {target} 的采集任务失败: {job}")
+                self.breakers.record_failure(target, permanent=True)
+            elif isinstance(job, Exception):
+                logger.error(f"提交 {target} 的采集任务异常: {job}")
+                self.breakers.record_failure(target)
+            elif job:
+                jobs.append(job)
+            else:
+                self.breakers.record_failure(target)
+
+        # 第二阶段：统一轮询所有结果ID
+        results: Dict[Tuple[str, str], TargetSessions] = {}
+
+        def on_finished(job: PendingJob, response_data):
+            target_sessions = job.handler.build_session_items(job.target, response_data)
+            results[job.target.key] = target_sessions
+            if on_result:
+                on_result(job.target.key, target_sessions)
+
+        unfinished = await self._poll_all(jobs, on_finished, deadline)
+        for job in unfinished:
+            self._carry_over(job.target, job)
+        das_carried_over_targets.set(len(self.carried))
+
+        if skipped or unfinished:
+            logger.warning(
+                f"超出时间预算: {skipped} 个目标未提交, {len(unfinished)} 个任务未完成, 顺延到下一轮"
+            )
+        logger.debug(
+            f"会话采集流水线完成: 目标 {len(targets)} 个, 提交成功 {len(jobs)} 个, "
+            f"完成 {len(results)} 个, 耗时 {time.monotonic() - start_time:.2f} 秒"
+        )
+        return results
@@ -0,0 +1,291 @@
+"""
+会话指标快照
+采集结果写入不可变快照，采集完成时整体替换引用，
+由自定义Collector在抓取时读取，抓取不会看到采集到一半的数据
+"""
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector, REGISTRY
+
+from config.settings import settings
+
+
+# 指标label顺序，序列的label值以元组形式按此顺序存储
+SESSION_LABELS = ('ins_id', 'ins_name', 'ins_type', 'aliyun_uid', 'db_user', 'node_id', 'node_type')
+INSTANCE_TOTAL_LABELS = tuple(label for label in SESSION_LABELS if label != 'db_user')
+CLIENT_LABELS = tuple('client_ip' if label == 'db_user' else label for label in SESSION_LABELS)
+MAX_CONNECTION_LABELS = ('ins_id', 'db_user')
+TARGET_LABELS = ('ins_id', 'node_id')
+# 会话利用率按实例汇总各节点，label为 SESSION_LABELS 中 node_id 之前的部分
+UTILIZATION_LABELS = SESSION_LABELS[:SESSION_LABELS.index('node_id')]
+
+# 超出 CLIENT_TOP_K 的客户端IP合并后的 client_ip
+CLIENT_OTHER = 'other'
+# 超出 USER_TOP_K 的用户合并后的 db_user
+USER_OTHER = '__other__'
+
+_DB_USER_INDEX = SESSION_LABELS.index('db_user')
+
+# 单条序列：(label值元组, 指标值)
+Sample = Tuple[Tuple[str, ...], float]
+
+
+class TargetSessions:
+    """
+    单个采集目标的会话序列及其采集时间（不可变）
+    samples: 各用户会话数，active_samples: 各用户活跃会话数（label同 SESSION_LABELS），
+    total: 目标总会话数（label为 INSTANCE_TOTAL_LABELS），
+    client_samples: 各客户端IP会话数（label为 CLIENT_LABELS），
+    opened_samples/closed_samples: 各用户累计新建/关闭会话数（开启会话变动统计时），
+    user_counts: 有 max_user_connections 上限的各用户会话数（label为 UTILIZATION_LABELS，
+    不受 USER_TOP_K 合并影响，只用于计算会话利用率，不直接导出）
+    """
+
+    __slots__ = (
+        'samples', 'active_samples', 'total', 'client_samples', 'opened_samples', 'closed_samples', 'user_counts',
+        'collected_at'
+    )
+
+    def __init__(
+        self,
+        samples: Tuple[Sample, ...],
+        collected_at: float,
+        active_samples: Tuple[Sample, ...] = (),
+        total: Optional[Sample] = None,
+        client_samples: Tuple[Sample, ...] = (),
+        opened_samples: Tuple[Sample, ...] = (),
+        closed_samples: Tuple[Sample, ...] = (),
+        user_counts: Tuple[Sample, ...] = ()
+    ):
+        self.samples = samples
+        self.active_samples = active_samples
+        self.total = total
+        self.client_samples = client_samples
+        self.opened_samples = opened_samples
+        self.closed_samples = closed_samples
+        self.user_counts = user_counts
+        self.collected_at = collected_at
+
+    def series_count(self) -> int:
+        """该目标导出的序列数"""
+        return (
+            len(self.samples) + len(self.active_samples) + len(self.client_samples)
+            + len(self.opened_samples) + len(self.closed_samples) + (self.total is not None)
+        )
+
+
+class MetricsSnapshot:
+    """
+    不可变指标快照
+    sessions: {(ins_id, node_id): 该目标的会话序列}
+    max_connections: 最大连接数序列
+    utilization: {ins_id: 各用户会话利用率序列}
+    """
+
+    __slots__ = ('sessions', 'session_timestamp', 'max_connections', 'max_connections_timestamp', 'utilization')
+
+    def __init__(
+        self,
+        sessions: Optional[Dict[Tuple[str, str], TargetSessions]] = None,
+        session_timestamp: float = 0,
+        max_connections: Tuple[Sample, ...] = (),
+        max_connections_timestamp: float = 0,
+        utilization: Optional[Dict[str, Tuple[Sample, ...]]] = None
+    ):
+        self.sessions = sessions if sessions is not None else {}
+        self.session_timestamp = session_timestamp
+        self.max_connections = max_connections
+        self.max_connections_timestamp = max_connections_timestamp
+        self.utilization = utilization if utilization is not None else {}
+
+    def replace(self, **changes) -> 'MetricsSnapshot':
+        """基于当前快照生成替换了部分字段的新快照"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return MetricsSnapshot(**fields)
+
+
+_snapshot = MetricsSnapshot()
+_snapshot_generation = 0  # 发布序列有变化的快照时递增，用于判断预渲染结果是否过期
+_snapshot_collector: Optional['SnapshotCollector'] = None
+
+
+def get_snapshot() -> MetricsSnapshot:
+    """获取当前快照"""
+    return _snapshot
+
+
+def get_snapshot_generation() -> int:
+    """获取当前快照代数"""
+    return _snapshot_generation
+
+
+def publish_snapshot(snapshot: MetricsSnapshot, changed: bool = True):
+    """
+    发布新快照（一次引用替换）
+    changed 为False表示与上一个快照相比只有时间戳变化，不使预渲染结果失效
+    """
+    global _snapshot, _snapshot_generation
+    _snapshot = snapshot
+    if changed:
+        _snapshot_generation += 1
+
+
+class SnapshotCollector(Collector):
+    """从快照生成会话数和最大连接数指标的自定义Collector"""
+
+    def __init__(self, snapshot_getter=get_snapshot):
+        self.snapshot_getter = snapshot_getter
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        snapshot = self.snapshot_getter()
+
+        session_count = GaugeMetricFamily(
+            'db_user_session_count', '数据库用户会话数', labels=SESSION_LABELS
+        )
+        active_session_count = GaugeMetricFamily(
+            'db_user_active_session_count', '数据库用户活跃会话数', labels=SESSION_LABELS
+        )
+        session_total = GaugeMetricFamily(
+            'db_instance_session_total', '实例（PolarDB为节点）总会话数', labels=INSTANCE_TOTAL_LABELS
+        )
+        client_session_count = GaugeMetricFamily(
+            'db_client_session_count', '客户端IP会话数（每个目标前 CLIENT_TOP_K 个IP，其余合并为 other）',
+            labels=CLIENT_LABELS
+        )
+        for target_sessions in snapshot.sessions.values():
+            for label_values, value in target_sessions.samples:
+                session_count.add_metric(label_values, value)
+            for label_values, value in target_sessions.active_samples:
+                active_session_count.add_metric(label_values, value)
+            if target_sessions.total is not None:
+                session_total.add_metric(*target_sessions.total)
+            for label_values, value in target_sessions.client_samples:
+                client_session_count.add_metric(label_values, value)
+        yield session_count
+        yield active_session_count
+        yield session_total
+        yield client_session_count
+
+        if settings.SESSION_CHURN_ENABLED:
+            sessions_opened = CounterMetricFamily(
+                'db_user_sessions_opened_total', '数据库用户新建会话数（相邻两次采集的 ThreadIdList 对比）',
+                labels=SESSION_LABELS
+            )
+            sessions_closed = CounterMetricFamily(
+                'db_user_sessions_closed_total', '数据库用户关闭会话数（相邻两次采集的 ThreadIdList 对比）',
+                labels=SESSION_LABELS
+            )
+            for target_sessions in snapshot.sessions.values():
+                for label_values, value in target_sessions.opened_samples:
+                    sessions_opened.add_metric(label_values, value)
+                for label_values, value in target_sessions.closed_samples:
+                    sessions_closed.add_metric(label_values, value)
+            yield sessions_opened
+            yield sessions_closed
+
+        max_connections = GaugeMetricFamily(
+            'db_max_user_connections', '用户最大连接数', labels=MAX_CONNECTION_LABELS
+        )
+        for label_values, value in snapshot.max_connections:
+            max_connections.add_metric(label_values, value)
+        yield max_connections
+
+        utilization = GaugeMetricFamily(
+            'db_user_session_utilization_ratio',
+            '数据库用户会话数与 max_user_connections 的比值（PolarDB为各节点之和）',
+            labels=UTILIZATION_LABELS
+        )
+        for samples in snapshot.utilization.values():
+            for label_values, value in samples:
+                utilization.add_metric(label_values, value)
+        yield utilization
+
+        # 各目标最后一次采集成功的时间，采集失败或熔断期间快照保留的是该时间的结果
+        last_success = GaugeMetricFamily(
+            'das_exporter_target_last_success_timestamp_seconds',
+            '采集目标最后一次成功采集的时间（Unix时间戳）',
+            labels=TARGET_LABELS
+        )
+        for key, target_sessions in snapshot.sessions.items():
+            last_success.add_metric(key, target_sessions.collected_at)
+        yield last_success
+
+        yield GaugeMetricFamily(
+            'das_exporter_snapshot_timestamp_seconds',
+            '当前会话数指标快照的采集完成时间（Unix时间戳）',
+            value=snapshot.session_timestamp
+        )
+
+
+def get_or_create_snapshot_collector() -> SnapshotCollector:
+    """获取或注册快照Collector，避免重复注册"""
+    global _snapshot_collector
+    if _snapshot_collector is None:
+        _snapshot_collector = SnapshotCollector()
+        REGISTRY.register(_snapshot_collector)
+    return _snapshot_collector
+
+
+def build_utilization(
+    sessions: Dict[Tuple[str, str], TargetSessions],
+    max_connections: Dict[Tuple[str, str], int],
+    ins_ids: Optional[Set[str]] = None
+) -> Dict[str, Tuple[Sample, ...]]:
+    """
+    计算各用户的会话利用率 {ins_id: 序列}，ins_ids 为None时计算全部实例
+    同一实例各节点采集时记录的各用户会话数（user_counts，未按 USER_TOP_K 合并）相加后
+    除以 max_connections 中 (ins_id, db_user) 的上限，没有上限和上限为0的用户不导出
+    """
+    totals: Dict[str, Dict[Tuple[str, ...], float]] = {}
+    for (ins_id, _), target_sessions in sessions.items():
+        if ins_ids is not None and ins_id not in ins_ids:
+            continue
+        instance_totals = totals.setdefault(ins_id, {})
+        for label_values, value in target_sessions.user_counts:
+            instance_totals[label_values] = instance_totals.get(label_values, 0) + value
+
+    utilization = {}
+    for ins_id, instance_totals in totals.items():
+        samples = []
+        for label_values, value in instance_totals.items():
+            limit = max_connections.get((ins_id, label_values[_DB_USER_INDEX]))
+            if limit:
+                samples.append((label_values, value / limit))
+        utilization[ins_id] = tuple(samples)
+    return utilization
+
+
+def with_utilization(
+    snapshot: MetricsSnapshot,
+    max_connections: Dict[Tuple[str, str], int],
+    ins_ids: Optional[Set[str]] = None
+) -> MetricsSnapshot:
+    """重新计算会话利用率，ins_ids 不为None时只更新这些实例"""
+    if ins_ids is None:
+        utilization = build_utilization(snapshot.sessions, max_connections)
+    else:
+        utilization = {
+            ins_id: samples for ins_id, samples in snapshot.utilization.items() if ins_id not in ins_ids
+        }
+        utilization.update(build_utilization(snapshot.sessions, max_connections, ins_ids))
+    return snapshot.replace(utilization=utilization)
+
+
+def subset_snapshot(snapshot: MetricsSnapshot, keys: List[Tuple[str, str]]) -> MetricsSnapshot:
+    """截取指定目标的快照，用于单实例探测输出"""
+    sessions = {key: snapshot.sessions[key] for key in keys if key in snapshot.sessions}
+    ins_ids = {ins_id for ins_id, _ in keys}
+    max_connections = tuple(
+        sample for sample in snapshot.max_connections if sample[0][0] in ins_ids
+    )
+    session_timestamp = min((item.collected_at for item in sessions.values()), default=0)
+    utilization = {ins_id: samples for ins_id, samples in snapshot.utilization.items() if ins_id in ins_ids}
+    return MetricsSnapshot(
+        sessions=sessions,
+        session_timestamp=session_timestamp,
+        max_connections=max_connections,
+        max_connections_timestamp=snapshot.max_connections_timestamp,
+        utilization=utilization
+    )
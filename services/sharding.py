@@ -0,0 +1,167 @@
+"""
+实例分片
+多个exporter副本按 ins_id 切分实例清单，每个副本只采集自己负责的实例；
+PolarDB实例的所有节点随 ins_id 一起分配，始终落在同一副本
+"""
+import bisect
+import hashlib
+import logging
+import os
+import re
+import socket
+from typing import Iterable, List, Optional, Set, Tuple
+
+from config.settings import settings
+from services.exporter_metrics import das_shard_owned_instances
+
+
+logger = logging.getLogger(__name__)
+
+
+def stable_hash(value: str) -> int:
+    """进程无关的稳定哈希（内置hash()每个进程随机化，不能用于分片）"""
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环，副本数变化时只有约 1/N 的实例需要迁移"""
+
+    def __init__(self, members: Iterable[str], virtual_nodes: int):
+        points = []
+        for member in members:
+            for i in range(virtual_nodes):
+                points.append((stable_hash(f"{member}#{i}"), member))
+        points.sort()
+        self._hashes = [point[0] for point in points]
+        self._members = [point[1] for point in points]
+
+    def get(self, key: str) -> Optional[str]:
+        """获取 key 所属的成员"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, stable_hash(key)) % len(self._hashes)
+        return self._members[index]
+
+
+class ShardSelector:
+    """
+    分片选择器
+    SHARD_MODE=modulo 按 hash(ins_id) % SHARD_COUNT 分配；
+    SHARD_MODE=ring 使用一致性哈希环，成员来自 SHARD_MEMBERS_FILE（每行一个副本名）
+    或由 SHARD_COUNT 生成，成员列表每轮重新读取，副本数变化时自动重新平衡
+    """
+
+    def __init__(self):
+        self._ring: Optional[HashRing] = None
+        self._ring_members: Tuple[str, ...] = ()
+        self._self_name = ''
+        self.owned_instances: Set[str] = set()
+        self.errors: List[str] = []
+
+    @property
+    def enabled(self) -> bool:
+        return settings.SHARD_MODE in ('modulo', 'ring')
+
+    @staticmethod
+    def shard_index() -> int:
+        """
+        本副本的分片序号
+        SHARD_INDEX < 0 时从主机名末尾的序号解析（如StatefulSet的 exporter-2）
+        """
+        if settings.SHARD_INDEX >= 0:
+            return settings.SHARD_INDEX
+        match = re.search(r'-(\d+)$', socket.gethostname())
+        return int(match.group(1)) if match else 0
+
+    def _members(self) -> Tuple[Tuple[str, ...], str]:
+        """获取环成员列表和本副本名称"""
+        if settings.SHARD_MEMBERS_FILE and os.path.exists(settings.SHARD_MEMBERS_FILE):
+            with open(settings.SHARD_MEMBERS_FILE) as f:
+                members = tuple(sorted({line.strip() for line in f if line.strip()}))
+            return members, settings.SHARD_SELF or socket.gethostname()
+        members = tuple(f"shard-{i}" for i in range(max(settings.SHARD_COUNT, 1)))
+        return members, f"shard-{self.shard_index()}"
+
+    def _refresh_ring(self) -> HashRing:
+        """重新读取成员列表，成员变化时重建哈希环"""
+        members, self_name = self._members()
+        if self._ring is None or members != self._ring_members:
+            if self._ring_members:
+                logger.info(f"分片成员变化: {len(self._ring_members)} -> {len(members)} 个副本，重新平衡")
+            self._ring = HashRing(members, settings.SHARD_VIRTUAL_NODES)
+            self._ring_members = members
+        self._self_name = self_name
+        return self._ring
+
+    def config_errors(self) -> List[str]:
+        """
+        检查分片配置，返回会导致本副本不负责任何实例的问题
+        分片序号超出 SHARD_COUNT、ring模式下本副本名称不在成员列表中、成员列表文件不存在
+        """
+        if not self.enabled:
+            return []
+        errors = []
+        if settings.SHARD_MODE == 'ring':
+            if settings.SHARD_MEMBERS_FILE and not os.path.exists(settings.SHARD_MEMBERS_FILE):
+                errors.append(f"分片成员列表文件 {settings.SHARD_MEMBERS_FILE} 不存在，改用 SHARD_COUNT 生成的成员")
+            members, self_name = self._members()
+            if self_name not in members:
+                errors.append(f"本副本 {self_name} 不在分片成员列表中，不负责任何实例")
+        else:
+            index = self.shard_index()
+            if not 0 <= index < max(settings.SHARD_COUNT, 1):
+                errors.append(f"分片序号 {index} 超出 SHARD_COUNT={settings.SHARD_COUNT}，不负责任何实例")
+        return errors
+
+    def check(self) -> List[str]:
+        """检查分片配置，问题有变化时记录错误日志"""
+        errors = self.config_errors()
+        if errors != self.errors:
+            for error in errors:
+                logger.error(f"分片配置错误: {error}")
+            if self.errors and not errors:
+                logger.info("分片配置错误已恢复")
+        self.errors = errors
+        return errors
+
+    def owns(self, ins_id: str) -> bool:
+        """判断实例是否由本副本负责，ring模式使用最近一次读取的成员列表"""
+        if not self.enabled:
+            return True
+        if settings.SHARD_MODE == 'modulo':
+            return stable_hash(ins_id) % max(settings.SHARD_COUNT, 1) == self.shard_index()
+        ring = self._ring or self._refresh_ring()
+        return ring.get(ins_id) == self._self_name
+
+    def filter_instances(self, instances: List) -> List:
+        """筛选本副本负责的实例，并记录归属结果"""
+        if not self.enabled:
+            self.owned_instances = {instance.ins_id for instance in instances}
+            das_shard_owned_instances.set(len(self.owned_instances))
+            return list(instances)
+
+        if settings.SHARD_MODE == 'ring':
+            # 成员列表每轮读取一次
+            self._refresh_ring()
+        self.check()
+        owned = [instance for instance in instances if self.owns(instance.ins_id)]
+
+        owned_ids = {instance.ins_id for instance in owned}
+        if owned_ids != self.owned_instances:
+            added = len(owned_ids - self.owned_instances)
+            removed = len(self.owned_instances - owned_ids)
+            logger.info(f"分片归属更新: 负责 {len(owned_ids)}/{len(instances)} 个实例 (+{added} -{removed})")
+        self.owned_instances = owned_ids
+        das_shard_owned_instances.set(len(owned_ids))
+        return owned
+
+
+_shard_selector: Optional[ShardSelector] = None
+
+
+def get_shard_selector() -> ShardSelector:
+    """获取全局分片选择器"""
+    global _shard_selector
+    if _shard_selector is None:
+        _shard_selector = ShardSelector()
+    return _shard_selector
@@ -0,0 +1,105 @@
+"""
+采集请求合并（singleflight）
+同一范围的采集同时只执行一次，期间到达的请求加入进行中的采集并共享结果，
+避免定时任务、/metrics 触发的后台刷新和 /refresh 同时发起多轮完整采集；
+单个目标同样按 key 合并，同一目标同时只有一个DAS任务
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from services.exporter_metrics import das_collections_joined
+
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """按 key 合并并发的协程调用"""
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def start(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """
+        启动采集，已有同范围的采集时直接返回进行中的任务
+        任务由本对象持有引用直到完成，调用方可以不等待结果
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            das_collections_joined.labels(scope=self._scope(key)).inc()
+            logger.debug(f"加入进行中的采集: {key}")
+            return task
+
+        task = asyncio.create_task(func())
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入采集并等待结果
+        等待方被取消（如客户端断开）不会取消共享的采集任务
+        """
+        return await asyncio.shield(self.start(key, func))
+
+    async def do_each(
+        self,
+        keys: List[Hashable],
+        func: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+    ) -> Dict[Hashable, Any]:
+        """
+        按单个 key 合并：已有进行中任务的 key 加入该任务，其余 key 由一次 func(keys) 调用完成
+        func 返回 {key: 结果}；返回本次各 key 的结果，没有结果的 key 不出现
+        """
+        tasks = []
+        fresh = []
+        for key in keys:
+            task = self._tasks.get(key)
+            if task is None:
+                fresh.append(key)
+            elif task not in tasks:
+                tasks.append(task)
+        if tasks:
+            das_collections_joined.labels(scope=self._scope(keys[0])).inc(len(keys) - len(fresh))
+            logger.debug(f"{len(keys) - len(fresh)} 个目标加入进行中的采集")
+        if fresh:
+            task = asyncio.create_task(func(fresh))
+            for key in fresh:
+                self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish_each(fresh, done))
+            tasks.append(task)
+
+        wanted = set(keys)
+        results: Dict[Hashable, Any] = {}
+        for outcome in await asyncio.shield(asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(outcome, BaseException):
+                logger.error(f"采集失败: {outcome}")
+                continue
+            results.update((key, value) for key, value in outcome.items() if key in wanted)
+        return results
+
+    async def cancel_all(self):
+        """取消所有进行中的任务（停止服务时）"""
+        tasks = list(set(self._tasks.values()))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finish_each(self, keys: List[Hashable], task: asyncio.Task):
+        for key in keys:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 标记异常已读取，无人等待的后台任务失败时不产生告警日志，异常由任务内部记录
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _scope(key: Hashable) -> str:
+        return key[0] if isinstance(key, tuple) else str(key)
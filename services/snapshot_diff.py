@@ -0,0 +1,122 @@
+"""
+快照差异计算
+发布快照前把新采集的序列与上一次的序列按label值元组对比，统计新增、变化和删除的序列数；
+值未变化的序列直接复用上一次的对象，label值元组以上一次的对象为准（按目标驻留），
+整个目标都没有变化时复用上一次的序列元组，所有序列都没有变化时发布快照不使输出缓存失效
+"""
+from typing import Dict, Optional, Tuple
+
+from services.exporter_metrics import das_series_changed
+from services.session_snapshot import Sample, TargetSessions
+
+
+# TargetSessions 中的序列字段（total 为单条序列，单独处理）
+SAMPLE_FIELDS = ('samples', 'active_samples', 'client_samples', 'opened_samples', 'closed_samples')
+
+
+class SeriesChanges:
+    """
+    一次发布中新增、变化和删除的序列数
+    utilization_inputs: 不直接导出的各用户会话数（user_counts）是否变化，变化时需要重新计算会话利用率
+    """
+
+    KINDS = ('added', 'changed', 'removed')
+    __slots__ = KINDS + ('utilization_inputs',)
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+        self.utilization_inputs = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    def record(self):
+        """累加到 das_exporter_series_changed_total"""
+        for kind in self.KINDS:
+            count = getattr(self, kind)
+            if count:
+                das_series_changed.labels(kind=kind).inc(count)
+
+
+def diff_samples(
+    previous: Tuple[Sample, ...],
+    current: Tuple[Sample, ...],
+    changes: SeriesChanges
+) -> Tuple[Sample, ...]:
+    """
+    对比一组序列，返回要发布的序列元组
+    值未变化的序列复用上一次的 (label值, 值) 对象，值变化的序列复用上一次的label值元组；
+    没有任何变化时返回 previous 本身
+    """
+    if previous is current:
+        return previous
+    if not previous:
+        changes.added += len(current)
+        return current
+
+    index = {sample[0]: sample for sample in previous}
+    merged = []
+    added = changed = 0
+    for label_values, value in current:
+        old = index.pop(label_values, None)
+        if old is None:
+            added += 1
+            merged.append((label_values, value))
+        elif old[1] == value:
+            merged.append(old)
+        else:
+            changed += 1
+            merged.append((old[0], value))
+
+    removed = len(index)
+    if not (added or changed or removed):
+        return previous
+    changes.added += added
+    changes.changed += changed
+    changes.removed += removed
+    return tuple(merged)
+
+
+def diff_target_sessions(
+    previous: Optional[TargetSessions],
+    current: TargetSessions,
+    changes: SeriesChanges
+) -> TargetSessions:
+    """对比同一目标两次采集的结果，返回复用了未变化序列的新结果"""
+    if previous is None:
+        changes.added += current.series_count()
+        changes.utilization_inputs |= bool(current.user_counts)
+        return current
+
+    fields = {name: diff_samples(getattr(previous, name), getattr(current, name), changes) for name in SAMPLE_FIELDS}
+    total = diff_samples(
+        (previous.total,) if previous.total is not None else (),
+        (current.total,) if current.total is not None else (),
+        changes
+    )
+    # user_counts 不是导出的序列，单独统计，只用于判断是否需要重新计算会话利用率
+    user_count_changes = SeriesChanges()
+    user_counts = diff_samples(previous.user_counts, current.user_counts, user_count_changes)
+    changes.utilization_inputs |= bool(user_count_changes)
+    return TargetSessions(
+        collected_at=current.collected_at,
+        total=total[0] if total else None,
+        user_counts=user_counts,
+        **fields
+    )
+
+
+def diff_utilization(
+    previous: Dict[str, Tuple[Sample, ...]],
+    current: Dict[str, Tuple[Sample, ...]],
+    changes: SeriesChanges
+) -> Dict[str, Tuple[Sample, ...]]:
+    """对比各实例的会话利用率序列，返回复用了未变化序列的结果"""
+    for ins_id, samples in previous.items():
+        if ins_id not in current:
+            changes.removed += len(samples)
+    return {
+        ins_id: diff_samples(previous.get(ins_id, ()), samples, changes) for ins_id, samples in current.items()
+    }
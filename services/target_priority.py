@@ -0,0 +1,66 @@
+"""
+采集目标优先级
+时间预算内先采集重要的目标：上一轮顺延的目标 > 接近 max_user_connections 的目标 > 读写节点 > 只读节点，
+同一档内历史耗时长的目标先开始
+"""
+from typing import Container, List, Tuple
+
+from config.settings import settings
+from services.base_handler import SessionTarget
+from services.inventory import InventoryIndex
+from services.poll_stats import PollLatencyTracker
+from services.session_snapshot import UTILIZATION_LABELS, MetricsSnapshot
+
+
+_DB_USER_INDEX = UTILIZATION_LABELS.index('db_user')
+
+
+class TargetPrioritizer:
+    """按优先级和历史耗时给采集目标排序"""
+
+    def __init__(self, inventory: InventoryIndex, poll_tracker: PollLatencyTracker):
+        self.inventory = inventory
+        self.poll_tracker = poll_tracker
+
+    def utilization(self, target: SessionTarget, snapshot: MetricsSnapshot) -> float:
+        """
+        目标上次采集结果中各用户 会话数/max_user_connections 的最大值，无数据时为0
+        使用未按 USER_TOP_K 合并的各用户会话数
+        """
+        target_sessions = snapshot.sessions.get(target.key)
+        if target_sessions is None:
+            return 0.0
+        ins_id = target.instance.ins_id
+        ratio = 0.0
+        for label_values, value in target_sessions.user_counts:
+            limit = self.inventory.max_connections.get((ins_id, label_values[_DB_USER_INDEX]))
+            if limit:
+                ratio = max(ratio, value / limit)
+        return ratio
+
+    def sort_key(
+        self,
+        target: SessionTarget,
+        snapshot: MetricsSnapshot,
+        carried: Container[Tuple[str, str]] = ()
+    ) -> Tuple[int, float]:
+        """排序键：(优先级档位, -预期耗时)，值越小越先采集"""
+        if target.key in carried:
+            tier = 0
+        elif self.utilization(target, snapshot) >= settings.PRIORITY_UTILIZATION_THRESHOLD:
+            tier = 1
+        elif target.node_type_label == 'write':
+            tier = 2
+        else:
+            tier = 3
+        expected = self.poll_tracker.expected_latency(target.key)
+        return tier, -(expected if expected is not None else settings.POLL_INTERVAL)
+
+    def order(
+        self,
+        targets: List[SessionTarget],
+        snapshot: MetricsSnapshot,
+        carried: Container[Tuple[str, str]] = ()
+    ) -> List[SessionTarget]:
+        """按优先级排序，顺序相同的目标保持原有顺序"""
+        return sorted(targets, key=lambda target: self.sort_key(target, snapshot, carried))
@@ -0,0 +1,119 @@
+"""熔断器状态转换和半开探测"""
+import pytest
+
+from config.settings import settings
+from models.instance import InstanceList
+from services.base_handler import SessionTarget
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry, CircuitBreaker
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'BREAKER_ENABLED', True)
+    monkeypatch.setattr(settings, 'BREAKER_COOLDOWN', 60)
+    monkeypatch.setattr(settings, 'BREAKER_MAX_COOLDOWN', 200)
+    monkeypatch.setattr(settings, 'POLL_TIMEOUT', 30)
+
+
+def open_breaker(now=0.0):
+    breaker = CircuitBreaker(threshold=2)
+    breaker.record_failure(now)
+    breaker.record_failure(now)
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(threshold=3)
+
+    assert not breaker.record_failure(0.0)
+    assert not breaker.record_failure(0.0)
+    assert breaker.allow(0.0)
+    assert breaker.record_failure(0.0)
+    assert breaker.state == OPEN
+    assert not breaker.allow(59.0)
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(threshold=2)
+
+    breaker.record_failure(0.0)
+    breaker.record_success()
+    assert not breaker.record_failure(0.0)
+    assert breaker.state == CLOSED
+
+
+def test_permanent_failure_opens_immediately():
+    breaker = CircuitBreaker(threshold=5)
+
+    assert breaker.record_failure(0.0, permanent=True)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_single_probe():
+    breaker = open_breaker()
+
+    assert breaker.allow(60.0)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(61.0)
+    # 探测超过 POLL_TIMEOUT 仍无结果时允许重新探测
+    assert breaker.allow(90.0)
+
+
+def test_release_returns_probe():
+    breaker = open_breaker()
+
+    assert breaker.allow(60.0)
+    breaker.release()
+    assert breaker.allow(61.0)
+
+
+def test_probe_success_closes():
+    breaker = open_breaker()
+    breaker.allow(60.0)
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow(61.0)
+    assert breaker.allow(61.0)
+
+
+def test_probe_failure_doubles_cooldown_up_to_max():
+    breaker = open_breaker()
+
+    for opened_at, cooldown in [(60.0, 120), (180.0, 200), (380.0, 200)]:
+        assert breaker.allow(opened_at)
+        assert breaker.record_failure(opened_at)
+        assert breaker.state == OPEN
+        assert breaker.cooldown == cooldown
+        assert not breaker.allow(opened_at + cooldown - 1)
+
+    breaker.allow(580.0)
+    breaker.record_success()
+    assert breaker.cooldown == 60
+
+
+def make_target(ins_id, aliyun_uid='uid-breaker'):
+    return SessionTarget(InstanceList(ins_id=ins_id, ins_name=ins_id, ins_type='rds', aliyun_uid=aliyun_uid))
+
+
+def test_registry_permanent_failure_opens_only_target(monkeypatch):
+    monkeypatch.setattr(settings, 'BREAKER_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(settings, 'BREAKER_ACCOUNT_FAILURE_THRESHOLD', 3)
+    breakers = BreakerRegistry()
+    broken, healthy = make_target('rm-broken'), make_target('rm-healthy')
+
+    breakers.record_failure(broken, permanent=True)
+    assert not breakers.allow(broken)
+    assert breakers.allow(healthy)
+
+
+def test_registry_account_breaker_blocks_all_targets(monkeypatch):
+    monkeypatch.setattr(settings, 'BREAKER_FAILURE_THRESHOLD', 10)
+    monkeypatch.setattr(settings, 'BREAKER_ACCOUNT_FAILURE_THRESHOLD', 2)
+    breakers = BreakerRegistry()
+    targets = [make_target('rm-a'), make_target('rm-b')]
+
+    for target in targets:
+        breakers.record_failure(target)
+    assert not any(breakers.allow(target) for target in targets)
+    assert breakers.allow(make_target('rm-c', aliyun_uid='uid-other'))
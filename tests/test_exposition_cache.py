@@ -0,0 +1,83 @@
+"""指标输出缓存：按快照代数渲染、gzip和ETag"""
+import asyncio
+import gzip
+
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from config.settings import settings
+from services import exposition_cache
+from services.exposition_cache import ExpositionCache, accepts_gzip, etag_matches
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    generation = [1]
+    monkeypatch.setattr(exposition_cache, 'get_snapshot_generation', lambda: generation[0])
+    monkeypatch.setattr(settings, 'EXPOSITION_MAX_AGE', 3600)
+    registry = CollectorRegistry()
+    gauge = Gauge('db_user_session_count', 'test', ['db_user'], registry=registry)
+    gauge.labels('app').set(3)
+    return ExpositionCache(registry), gauge, generation
+
+
+def test_renders_once_per_generation(cache):
+    renderer, gauge, generation = cache
+
+    first = asyncio.run(renderer.get())
+    gauge.labels('app').set(4)
+    # 代数未变化时返回同一渲染结果
+    assert asyncio.run(renderer.get()) is first
+    assert b'db_user_session_count{db_user="app"} 3.0' in first.identity
+
+    generation[0] += 1
+    second = asyncio.run(renderer.get())
+    assert second is not first
+    assert b'db_user_session_count{db_user="app"} 4.0' in second.identity
+    assert second.etag != first.etag
+
+
+def test_rerenders_after_max_age(cache, monkeypatch):
+    renderer, gauge, _ = cache
+
+    first = asyncio.run(renderer.get())
+    monkeypatch.setattr(settings, 'EXPOSITION_MAX_AGE', 0)
+    second = asyncio.run(renderer.get())
+    assert second is not first
+    # 内容相同时ETag相同
+    assert second.etag == first.etag
+
+
+def test_gzip_matches_identity(cache):
+    renderer, _, _ = cache
+    rendered = asyncio.run(renderer.get())
+
+    assert gzip.decompress(rendered.gzip) == rendered.identity
+    # mtime=0，相同内容的压缩结果稳定
+    assert asyncio.run(ExpositionCache(renderer.registry).get()).gzip == rendered.gzip
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('GZIP', True),
+    ('*', True),
+    ('gzip;q=0', False),
+    ('gzip;q=bad', False),
+    ('identity', False),
+    ('', False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
+
+
+@pytest.mark.parametrize('if_none_match, expected', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ('*', True),
+    ('"other"', False),
+    ('', False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, '"abc"') is expected
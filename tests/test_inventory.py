@@ -0,0 +1,108 @@
+"""实例清单表镜像的增量同步和删除检测"""
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, insert, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models.instance import InstanceNodeId
+from services.inventory import TableMirror
+
+T0 = datetime(2026, 1, 1, 0, 0, 0)
+T1 = datetime(2026, 1, 1, 0, 1, 0)
+
+
+def node(row_id, node_id, updatetime=T0, node_type=0):
+    return {'id': row_id, 'ins_id': 'pc-1', 'node_id': node_id, 'node_type': node_type, 'updatetime': updatetime}
+
+
+@pytest.fixture
+def mirror_db(tmp_path):
+    """mirror_db(*statements): 执行语句后同步一次，返回 (是否有变化, 镜像)"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'inventory.db'}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    mirror = TableMirror(InstanceNodeId)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(InstanceNodeId.__table__.create)
+
+    async def step(statements):
+        async with session_factory() as db:
+            for statement in statements:
+                await db.execute(statement)
+            await db.commit()
+            return await mirror.sync(db)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(setup())
+    yield lambda *statements: (loop.run_until_complete(step(statements)), mirror)
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+def node_ids(mirror):
+    return {row_id: row.node_id for row_id, row in mirror.rows.items()}
+
+
+def test_first_sync_loads_all(mirror_db):
+    changed, mirror = mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a'), node(2, 'pi-b')]))
+
+    assert changed
+    assert node_ids(mirror) == {1: 'pi-a', 2: 'pi-b'}
+    assert mirror.watermark == T0
+    assert mirror.version == 1
+
+
+def test_unchanged_rows_at_watermark_are_not_changes(mirror_db):
+    mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a'), node(2, 'pi-b')]))
+
+    changed, mirror = mirror_db()
+    assert not changed
+    assert mirror.version == 1
+
+
+def test_incremental_update_and_insert(mirror_db):
+    mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a'), node(2, 'pi-b')]))
+
+    changed, mirror = mirror_db(
+        update(InstanceNodeId).where(InstanceNodeId.id == 2).values(node_type=1, updatetime=T1),
+        insert(InstanceNodeId).values([node(3, 'pi-c', T1)])
+    )
+    assert changed
+    assert node_ids(mirror) == {1: 'pi-a', 2: 'pi-b', 3: 'pi-c'}
+    assert mirror.rows[2].node_type == 1
+    assert mirror.watermark == T1
+    assert mirror.version == 2
+
+
+def test_same_second_update_is_not_missed(mirror_db):
+    mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a')]))
+
+    # 与水位同一秒的更新
+    changed, mirror = mirror_db(
+        update(InstanceNodeId).where(InstanceNodeId.id == 1).values(node_id='pi-a2', updatetime=T0)
+    )
+    assert changed
+    assert node_ids(mirror) == {1: 'pi-a2'}
+
+
+def test_delete_triggers_full_reload(mirror_db):
+    mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a'), node(2, 'pi-b'), node(3, 'pi-c')]))
+
+    changed, mirror = mirror_db(delete(InstanceNodeId).where(InstanceNodeId.id == 2))
+    assert changed
+    assert node_ids(mirror) == {1: 'pi-a', 3: 'pi-c'}
+
+
+def test_delete_and_insert_with_same_count(mirror_db):
+    mirror_db(insert(InstanceNodeId).values([node(1, 'pi-a'), node(2, 'pi-b')]))
+
+    # 行数不变但最大ID变化，插入的行带旧的 updatetime 也能发现删除
+    changed, mirror = mirror_db(
+        delete(InstanceNodeId).where(InstanceNodeId.id == 1),
+        insert(InstanceNodeId).values([node(5, 'pi-e', datetime(2025, 1, 1))])
+    )
+    assert changed
+    assert node_ids(mirror) == {2: 'pi-b', 5: 'pi-e'}
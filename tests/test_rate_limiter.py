@@ -0,0 +1,88 @@
+"""令牌桶预扣/归还和AIMD速率调整"""
+import types
+
+import pytest
+
+from config.settings import settings
+from services import rate_limiter
+from services.rate_limiter import TokenBucket, get_rate_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(settings, 'DAS_API_AIMD_INTERVAL', 10.0)
+    monkeypatch.setattr(settings, 'DAS_API_AIMD_DECREASE', 0.5)
+    monkeypatch.setattr(settings, 'DAS_API_AIMD_INCREASE', 1.0)
+    monkeypatch.setattr(settings, 'DAS_API_RATE_MIN', 1.0)
+    return now
+
+
+def test_reserve_queues_callers_in_order(clock):
+    bucket = TokenBucket(rate=2.0, burst=2.0)
+
+    assert [bucket.reserve() for _ in range(5)] == [0.0, 0.0, 0.5, 1.0, 1.5]
+    clock[0] += 1.0
+    assert bucket.reserve() == 1.0
+
+
+def test_refund_returns_unused_token(clock):
+    bucket = TokenBucket(rate=2.0, burst=1.0)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.5
+    bucket.refund()
+    assert bucket.reserve() == 0.5
+
+
+def test_refund_does_not_exceed_burst(clock):
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+
+    bucket.refund()
+    bucket.refund()
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 1.0]
+
+
+def test_throttled_decreases_once_per_interval(clock):
+    bucket = TokenBucket(rate=8.0, burst=4.0)
+
+    assert bucket.on_throttled()
+    assert bucket.rate == 4.0
+    # 同一批调用的其他流控错误不再降速
+    assert not bucket.on_throttled()
+    assert bucket.rate == 4.0
+    # 剩余令牌已清空
+    assert bucket.reserve() == 0.25
+
+    clock[0] += 10.0
+    assert bucket.on_throttled()
+    assert bucket.rate == 2.0
+
+
+def test_throttled_rate_has_floor(clock):
+    bucket = TokenBucket(rate=1.5, burst=1.0)
+
+    bucket.on_throttled()
+    assert bucket.rate == 1.0
+
+
+def test_success_recovers_additively_up_to_max(clock):
+    bucket = TokenBucket(rate=4.0, burst=1.0)
+    bucket.on_throttled()
+    assert bucket.rate == 2.0
+
+    bucket.on_success()
+    assert bucket.rate == 2.0
+    for expected in (3.0, 4.0, 4.0):
+        clock[0] += 10.0
+        bucket.on_success()
+        assert bucket.rate == expected
+
+
+def test_rate_limiter_shared_per_account_and_endpoint():
+    limiter = get_rate_limiter('uid-limiter-test', 'das.cn-shanghai.aliyuncs.com')
+
+    assert get_rate_limiter('uid-limiter-test', 'das.cn-shanghai.aliyuncs.com') is limiter
+    assert get_rate_limiter('uid-limiter-test', 'das.ap-southeast-1.aliyuncs.com') is not limiter
+    assert get_rate_limiter('uid-limiter-other', 'das.cn-shanghai.aliyuncs.com') is not limiter
@@ -0,0 +1,65 @@
+"""会话变动统计按 USER_TOP_K 合并前的各用户线程ID对比"""
+import json
+import types
+
+import pytest
+
+from config.settings import settings
+from models.instance import InstanceList
+from services import session_churn
+from services.base_handler import SessionTarget
+from services.rds_handler import RDSHandler
+from services.session_parser import parse_session_response
+from services.session_snapshot import USER_OTHER
+
+
+def build_response(users):
+    """users: {db_user: (会话数, 线程ID)}"""
+    return parse_session_response(json.dumps({
+        'Code': '200',
+        'Success': True,
+        'Data': {
+            'ResultId': 'result-1',
+            'IsFinish': True,
+            'State': 'SUCCESS',
+            'SessionData': {
+                'UserStats': [
+                    {'Key': user, 'UserList': [user], 'TotalCount': count, 'ActiveCount': 0,
+                     'ThreadIdList': thread_ids}
+                    for user, (count, thread_ids) in users.items()
+                ],
+            },
+        },
+    }), keep_thread_ids=True)
+
+
+def by_user(samples):
+    return {label_values[4]: value for label_values, value in samples}
+
+
+@pytest.fixture
+def collect(monkeypatch):
+    monkeypatch.setattr(settings, 'USER_TOP_K', 1)
+    monkeypatch.setattr(settings, 'SESSION_CHURN_ENABLED', True)
+    monkeypatch.setattr(session_churn, '_churn_tracker', session_churn.ChurnTracker())
+    handler = RDSHandler(types.SimpleNamespace(max_connections={}), None)
+    target = SessionTarget(InstanceList(ins_id='rm-1', ins_name='rds1', ins_type='rds', aliyun_uid='uid-test'))
+    return lambda users: handler.build_session_items(target, build_response(users))
+
+
+def test_top_k_change_is_not_churn(collect):
+    app_threads = [1, 2, 3]
+    batch_threads = [10, 11]
+    for app_count, batch_count in [(3, 2), (1, 2), (3, 2), (1, 2)]:
+        target_sessions = collect({'app': (app_count, app_threads), 'batch': (batch_count, batch_threads)})
+        assert len(by_user(target_sessions.samples)) == 2
+        assert set(by_user(target_sessions.opened_samples).values()) == {0}
+        assert set(by_user(target_sessions.closed_samples).values()) == {0}
+
+
+def test_folded_users_churn_counts_as_other(collect):
+    collect({'app': (3, [1, 2, 3]), 'batch': (2, [10, 11]), 'dev': (1, [20])})
+    target_sessions = collect({'app': (3, [1, 2, 3]), 'batch': (2, [10, 12])})
+
+    assert by_user(target_sessions.opened_samples) == {'app': 0, USER_OTHER: 1}
+    assert by_user(target_sessions.closed_samples) == {'app': 0, USER_OTHER: 2}
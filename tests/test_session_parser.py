@@ -0,0 +1,130 @@
+"""GetMySQLAllSessionAsync 响应轻量解析与SDK模型解析的一致性"""
+import json
+
+import pytest
+from alibabacloud_das20200116 import models as das20200116_models
+
+from services.base_handler import BaseHandler
+from services.session_parser import parse_session_response, strip_session_details
+
+
+def build_body(sql_texts, finished=True):
+    """构造响应体，SessionList 中每个会话的 SqlText 依次取 sql_texts"""
+    return {
+        'Code': '200',
+        'Success': True,
+        'RequestId': 'req-1',
+        'Data': {
+            'ResultId': 'result-1',
+            'IsFinish': finished,
+            'State': 'SUCCESS' if finished else 'RUNNING',
+            'Fail': False,
+            'SessionData': {
+                'TotalSessionCount': 5,
+                'ActiveSessionCount': 2,
+                'SessionList': [
+                    {'SessionId': index, 'User': 'app', 'SqlText': sql_text, 'Command': 'Query'}
+                    for index, sql_text in enumerate(sql_texts)
+                ],
+                'UserStats': [
+                    {'Key': 'app', 'UserList': ['app'], 'TotalCount': 4, 'ActiveCount': 2,
+                     'ThreadIdList': [11, 12, 13, 14]},
+                    {'Key': 'dba', 'UserList': ['dba'], 'TotalCount': 1, 'ActiveCount': 0,
+                     'ThreadIdList': [21]},
+                ],
+                'ClientStats': [
+                    {'Key': '10.0.0.1', 'UserList': ['app', 'dba'], 'TotalCount': 5, 'ActiveCount': 2,
+                     'ThreadIdList': [11, 12, 13, 14, 21]},
+                ],
+            },
+        },
+    }
+
+
+def sdk_parse(raw):
+    return das20200116_models.GetMySQLAllSessionAsyncResponseBody().from_map(json.loads(raw))
+
+
+def exported_fields(body, keep_thread_ids):
+    """导出指标用到的字段"""
+    data = body.data
+    session_data = data.session_data
+
+    def stats(items):
+        return [
+            (item.key, list(item.user_list or []), item.total_count, item.active_count,
+             list(item.thread_id_list or []) if keep_thread_ids else None)
+            for item in items or []
+        ]
+
+    return (
+        data.result_id, data.is_finish, data.state,
+        session_data.total_session_count, session_data.active_session_count,
+        stats(session_data.user_stats), stats(session_data.client_stats),
+    )
+
+
+SQL_TEXTS = {
+    'bracket': ['select * from t where a in (1) and b = "]"', 'select ]]] from t'],
+    # SQL中的双引号在JSON中转义为 \"
+    'escaped_quote': ['select "a]b" from t', 'select \'"]\'', 'update t set c = ""'],
+    # SQL中的反斜杠在JSON中转义为 \\，之后的 \" 不能再按引号计数判断
+    'backslash': ['select "C:\\data\\]" from t', 'select "\\"', 'select "a\\"]b"'],
+    'mixed': ['select "]"', 'select "\\"]\\\\"', 'select "[{]}"'],
+}
+
+
+@pytest.mark.parametrize('name', sorted(SQL_TEXTS))
+@pytest.mark.parametrize('keep_thread_ids', [False, True])
+def test_fast_parser_matches_sdk(name, keep_thread_ids):
+    raw = json.dumps(build_body(SQL_TEXTS[name]))
+    fast = parse_session_response(raw, keep_thread_ids)
+    assert exported_fields(fast, keep_thread_ids) == exported_fields(sdk_parse(raw), keep_thread_ids)
+    if not keep_thread_ids:
+        assert all(not item.thread_id_list for item in fast.data.session_data.user_stats)
+
+
+@pytest.mark.parametrize('name', ['bracket', 'escaped_quote'])
+def test_session_list_is_stripped(name):
+    raw = json.dumps(build_body(SQL_TEXTS[name]))
+    stripped = json.loads(strip_session_details(raw))
+    assert stripped['Data']['SessionData']['SessionList'] == []
+    assert stripped['Data']['SessionData']['UserStats'][0]['ThreadIdList'] == []
+
+
+def test_backslash_keeps_valid_json():
+    # 含转义反斜杠时不剔除 SessionList，结果仍是合法JSON
+    raw = json.dumps(build_body(SQL_TEXTS['backslash']))
+    stripped = json.loads(strip_session_details(raw))
+    assert len(stripped['Data']['SessionData']['SessionList']) == len(SQL_TEXTS['backslash'])
+
+
+def test_compact_and_pretty_json():
+    body = build_body(SQL_TEXTS['mixed'])
+    for raw in (json.dumps(body, separators=(',', ':')), json.dumps(body, indent=2)):
+        assert exported_fields(parse_session_response(raw), False) == exported_fields(sdk_parse(raw), False)
+
+
+@pytest.mark.parametrize('body', [
+    {'Code': '-1', 'Success': False},
+    {'Code': '-1', 'Success': False, 'Message': 'InternalError', 'Data': None},
+    {'Code': '200', 'Success': 'false', 'Data': {'ResultId': 'result-1'}},
+])
+def test_error_response_without_data(body):
+    raw = json.dumps(body)
+    for parsed in (parse_session_response(raw), sdk_parse(raw)):
+        assert BaseHandler.is_error_response(parsed)
+        assert BaseHandler.is_job_failed(parsed)
+
+
+def test_success_response_is_not_error():
+    raw = json.dumps(build_body(['select 1'], finished=False))
+    for parsed in (parse_session_response(raw), sdk_parse(raw)):
+        assert not BaseHandler.is_error_response(parsed)
+        assert not BaseHandler.is_job_failed(parsed)
+
+
+@pytest.mark.parametrize('raw', [None, '', '  \n', 'null', '[]'])
+def test_empty_body_returns_none(raw):
+    assert parse_session_response(raw) is None
+    assert parse_session_response(raw, keep_thread_ids=True) is None
@@ -0,0 +1,52 @@
+"""会话采集流水线的轮询调度"""
+import asyncio
+import json
+import types
+
+import pytest
+
+from config.settings import settings
+from models.instance import InstanceList
+from services.base_handler import SessionTarget
+from services.circuit_breaker import get_breakers
+from services.session_parser import parse_session_response
+from services.session_pipeline import PendingJob, SessionPipeline
+
+
+FINISHED = {'Code': '200', 'Success': True, 'Data': {'ResultId': 'r', 'IsFinish': True, 'State': 'SUCCESS'}}
+BUSINESS_ERROR = {'Code': '-1', 'Success': False}
+
+
+class FakeHandler:
+    """按 ins_id 返回固定的轮询响应"""
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    async def poll_session_job(self, client, target, result_id, latest_start=None):
+        await asyncio.sleep(0)
+        return parse_session_response(json.dumps(self.responses[target.instance.ins_id]))
+
+
+def make_target(ins_id):
+    instance = InstanceList(ins_id=ins_id, ins_name=ins_id, ins_type='rds', aliyun_uid='uid-test')
+    return SessionTarget(instance)
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(settings, 'POLL_INTERVAL', 0.01)
+
+
+def test_error_response_does_not_abort_other_targets():
+    handler = FakeHandler({'rm-0': BUSINESS_ERROR, 'rm-1': FINISHED, 'rm-2': FINISHED})
+    targets = [make_target(ins_id) for ins_id in ('rm-0', 'rm-1', 'rm-2')]
+    pipeline = SessionPipeline(types.SimpleNamespace(inventory=None))
+    jobs = [PendingJob(target, handler, None, f"result-{target.instance.ins_id}") for target in targets]
+    finished = []
+
+    unfinished = asyncio.run(pipeline._poll_all(jobs, lambda job, response: finished.append(job.target.key)))
+
+    assert unfinished == []
+    assert sorted(finished) == [('rm-1', ''), ('rm-2', '')]
+    assert get_breakers().targets[('rm-0', '')].failures == 1
@@ -0,0 +1,123 @@
+"""实例分片：modulo 与一致性哈希环"""
+import hashlib
+import types
+
+import pytest
+
+from config.settings import settings
+from services.sharding import HashRing, ShardSelector, stable_hash
+
+INS_IDS = [f"rm-{i:04d}" for i in range(2000)]
+
+
+def make_instances(ins_ids):
+    return [types.SimpleNamespace(ins_id=ins_id) for ins_id in ins_ids]
+
+
+def owners(mode, shard_count, monkeypatch, members_file=''):
+    """各副本负责的实例"""
+    monkeypatch.setattr(settings, 'SHARD_MODE', mode)
+    monkeypatch.setattr(settings, 'SHARD_COUNT', shard_count)
+    monkeypatch.setattr(settings, 'SHARD_MEMBERS_FILE', members_file)
+    result = {}
+    for index in range(shard_count):
+        monkeypatch.setattr(settings, 'SHARD_INDEX', index)
+        selector = ShardSelector()
+        result[index] = {instance.ins_id for instance in selector.filter_instances(make_instances(INS_IDS))}
+    return result
+
+
+def test_stable_hash_is_process_independent():
+    assert stable_hash('rm-0001') == int.from_bytes(hashlib.md5(b'rm-0001').digest()[:8], 'big')
+
+
+@pytest.mark.parametrize('mode', ['modulo', 'ring'])
+def test_every_instance_owned_exactly_once(mode, monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_VIRTUAL_NODES', 100)
+    shards = owners(mode, 4, monkeypatch)
+
+    assert sum(len(owned) for owned in shards.values()) == len(INS_IDS)
+    assert set().union(*shards.values()) == set(INS_IDS)
+    assert all(len(owned) > len(INS_IDS) / 8 for owned in shards.values())
+
+
+def test_modulo_assignment(monkeypatch):
+    shards = owners('modulo', 3, monkeypatch)
+
+    for index, owned in shards.items():
+        assert all(stable_hash(ins_id) % 3 == index for ins_id in owned)
+
+
+def test_ring_moves_fewer_instances_than_modulo(monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_VIRTUAL_NODES', 100)
+
+    def moved(mode):
+        before = {ins_id: index for index, owned in owners(mode, 4, monkeypatch).items() for ins_id in owned}
+        after = {ins_id: index for index, owned in owners(mode, 5, monkeypatch).items() for ins_id in owned}
+        return sum(before[ins_id] != after[ins_id] for ins_id in INS_IDS)
+
+    ring_moved = moved('ring')
+    # 扩容到5个副本，一致性哈希只迁移约 1/5，取模迁移约 4/5
+    assert ring_moved < len(INS_IDS) * 0.3
+    assert moved('modulo') > len(INS_IDS) * 0.6
+    assert ring_moved < moved('modulo')
+
+
+def test_hash_ring_without_members():
+    assert HashRing([], 10).get('rm-0001') is None
+
+
+def test_ring_members_file(tmp_path, monkeypatch):
+    members_file = tmp_path / 'members'
+    members_file.write_text('exporter-b\nexporter-a\n\nexporter-a\n')
+    monkeypatch.setattr(settings, 'SHARD_MODE', 'ring')
+    monkeypatch.setattr(settings, 'SHARD_MEMBERS_FILE', str(members_file))
+    monkeypatch.setattr(settings, 'SHARD_VIRTUAL_NODES', 100)
+
+    owned = {}
+    for name in ('exporter-a', 'exporter-b'):
+        monkeypatch.setattr(settings, 'SHARD_SELF', name)
+        selector = ShardSelector()
+        owned[name] = {instance.ins_id for instance in selector.filter_instances(make_instances(INS_IDS))}
+        assert selector.errors == []
+    assert owned['exporter-a'].isdisjoint(owned['exporter-b'])
+    assert owned['exporter-a'] | owned['exporter-b'] == set(INS_IDS)
+
+
+def test_index_outside_shard_count_reported(monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_MODE', 'modulo')
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 3)
+    monkeypatch.setattr(settings, 'SHARD_INDEX', 3)
+    selector = ShardSelector()
+
+    assert selector.filter_instances(make_instances(INS_IDS)) == []
+    assert len(selector.errors) == 1
+
+
+def test_ring_self_not_member_reported(tmp_path, monkeypatch):
+    members_file = tmp_path / 'members'
+    members_file.write_text('exporter-a\n')
+    monkeypatch.setattr(settings, 'SHARD_MODE', 'ring')
+    monkeypatch.setattr(settings, 'SHARD_MEMBERS_FILE', str(members_file))
+    monkeypatch.setattr(settings, 'SHARD_SELF', 'exporter-z')
+    selector = ShardSelector()
+
+    assert selector.filter_instances(make_instances(INS_IDS)) == []
+    assert any('exporter-z' in error for error in selector.errors)
+
+
+def test_ring_missing_members_file_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_MODE', 'ring')
+    monkeypatch.setattr(settings, 'SHARD_MEMBERS_FILE', str(tmp_path / 'missing'))
+    monkeypatch.setattr(settings, 'SHARD_COUNT', 2)
+    monkeypatch.setattr(settings, 'SHARD_INDEX', 0)
+
+    assert any('missing' in error for error in ShardSelector().check())
+
+
+def test_disabled_owns_everything(monkeypatch):
+    monkeypatch.setattr(settings, 'SHARD_MODE', 'none')
+    selector = ShardSelector()
+
+    assert len(selector.filter_instances(make_instances(INS_IDS))) == len(INS_IDS)
+    assert selector.check() == []
@@ -0,0 +1,105 @@
+"""采集请求合并"""
+import asyncio
+
+from services.singleflight import SingleFlight
+
+
+def test_do_joins_running_call():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def collect():
+            calls.append(1)
+            await release.wait()
+            return 'snapshot'
+
+        waiters = [asyncio.create_task(flight.do(('full',), collect)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        # 完成后再次调用重新执行
+        again = await flight.do(('full',), collect)
+        return calls, results, again
+
+    calls, results, again = asyncio.run(run())
+    assert results == ['snapshot'] * 3
+    assert again == 'snapshot'
+    assert len(calls) == 2
+
+
+def test_do_waiter_cancel_keeps_shared_task():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def collect():
+            await release.wait()
+            return 'snapshot'
+
+        first = asyncio.create_task(flight.do('full', collect))
+        second = asyncio.create_task(flight.do('full', collect))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return first.cancelled(), await second
+
+    assert asyncio.run(run()) == (True, 'snapshot')
+
+
+def test_do_each_joins_running_keys():
+    async def run():
+        flight = SingleFlight()
+        batches = []
+        release = asyncio.Event()
+
+        async def collect(keys):
+            batches.append(list(keys))
+            await release.wait()
+            return {key: f'result-{key}' for key in keys}
+
+        first = asyncio.create_task(flight.do_each(['a', 'b'], collect))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do_each(['b', 'c'], collect))
+        await asyncio.sleep(0)
+        release.set()
+        return batches, await first, await second
+
+    batches, first, second = asyncio.run(run())
+    assert batches == [['a', 'b'], ['c']]
+    assert first == {'a': 'result-a', 'b': 'result-b'}
+    # 加入的任务中不属于本次的 key 不返回
+    assert second == {'b': 'result-b', 'c': 'result-c'}
+
+
+def test_do_each_skips_failed_batch():
+    async def run():
+        flight = SingleFlight()
+
+        async def collect(keys):
+            raise RuntimeError('DAS unavailable')
+
+        return await flight.do_each(['a'], collect), flight._tasks
+
+    results, tasks = asyncio.run(run())
+    assert results == {}
+    assert tasks == {}
+
+
+def test_cancel_all():
+    async def run():
+        flight = SingleFlight()
+
+        async def collect(keys=None):
+            await asyncio.sleep(3600)
+
+        full = flight.start('full', collect)
+        each = asyncio.create_task(flight.do_each(['a', 'b'], collect))
+        await asyncio.sleep(0)
+        await flight.cancel_all()
+        await asyncio.sleep(0)
+        return full.cancelled(), await each, flight._tasks
+
+    assert asyncio.run(run()) == (True, {}, {})
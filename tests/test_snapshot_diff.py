@@ -0,0 +1,95 @@
+"""快照差异计算和未变化序列的复用"""
+from services.session_snapshot import TargetSessions
+from services.snapshot_diff import SeriesChanges, diff_samples, diff_target_sessions
+
+APP = ('rm-1', 'rds1', 'rds', 'uid-test', 'app')
+BATCH = ('rm-1', 'rds1', 'rds', 'uid-test', 'batch')
+DEV = ('rm-1', 'rds1', 'rds', 'uid-test', 'dev')
+TOTAL = ('rm-1', 'rds1', 'rds', 'uid-test')
+
+
+def counts(changes):
+    return changes.added, changes.changed, changes.removed
+
+
+def test_unchanged_returns_previous():
+    previous = ((APP, 3), (BATCH, 2))
+    changes = SeriesChanges()
+
+    # 值相同但是新创建的元组
+    assert diff_samples(previous, ((tuple(APP), 3), (tuple(BATCH), 2)), changes) is previous
+    assert not changes
+
+
+def test_added_changed_removed():
+    previous = ((APP, 3), (BATCH, 2))
+    changes = SeriesChanges()
+
+    merged = diff_samples(previous, ((tuple(APP), 3), (tuple(BATCH), 5), (DEV, 1)), changes)
+    assert merged == ((APP, 3), (BATCH, 5), (DEV, 1))
+    # 未变化的序列复用上一次的对象，变化的序列复用上一次的label值元组
+    assert merged[0] is previous[0]
+    assert merged[1][0] is previous[1][0]
+    assert counts(changes) == (1, 1, 0)
+
+    changes = SeriesChanges()
+    assert diff_samples(merged, ((APP, 3),), changes) == ((APP, 3),)
+    assert counts(changes) == (0, 0, 2)
+
+
+def test_empty_previous_counts_all_added():
+    current = ((APP, 3),)
+    changes = SeriesChanges()
+
+    assert diff_samples((), current, changes) is current
+    assert counts(changes) == (1, 0, 0)
+
+
+def make_target_sessions(app_count, total, collected_at, user_counts=()):
+    return TargetSessions(
+        ((APP, app_count), (BATCH, 2)), collected_at, ((APP, 1),), (TOTAL, total), (),
+        user_counts=user_counts
+    )
+
+
+def test_first_target_result_counts_all_added():
+    current = make_target_sessions(3, 5, 100.0, user_counts=((APP, 3),))
+    changes = SeriesChanges()
+
+    assert diff_target_sessions(None, current, changes) is current
+    assert counts(changes) == (current.series_count(), 0, 0)
+    assert changes.utilization_inputs
+
+
+def test_unchanged_target_reuses_series():
+    previous = make_target_sessions(3, 5, 100.0)
+    changes = SeriesChanges()
+
+    result = diff_target_sessions(previous, make_target_sessions(3, 5, 160.0), changes)
+    assert not changes
+    assert result.collected_at == 160.0
+    assert result.samples is previous.samples
+    assert result.active_samples is previous.active_samples
+    assert result.total is previous.total
+
+
+def test_changed_target_counts_each_field():
+    previous = make_target_sessions(3, 5, 100.0)
+    changes = SeriesChanges()
+
+    result = diff_target_sessions(previous, make_target_sessions(4, 6, 160.0), changes)
+    assert counts(changes) == (0, 2, 0)
+    assert result.samples == ((APP, 4), (BATCH, 2))
+    assert result.samples[1] is previous.samples[1]
+    assert result.active_samples is previous.active_samples
+    assert result.total == (TOTAL, 6)
+    assert not changes.utilization_inputs
+
+
+def test_user_counts_change_is_not_exported_series():
+    previous = make_target_sessions(3, 5, 100.0, user_counts=((APP, 3),))
+    changes = SeriesChanges()
+
+    diff_target_sessions(previous, make_target_sessions(3, 5, 160.0, user_counts=((APP, 4),)), changes)
+    assert not changes
+    assert changes.utilization_inputs
@@ -0,0 +1,47 @@
+"""会话利用率不受 USER_TOP_K 合并影响"""
+import json
+import types
+
+from config.settings import settings
+from models.instance import InstanceList
+from services.base_handler import SessionTarget
+from services.rds_handler import RDSHandler
+from services.session_parser import parse_session_response
+from services.session_snapshot import USER_OTHER, build_utilization
+
+
+def build_response(user_counts):
+    return parse_session_response(json.dumps({
+        'Code': '200',
+        'Success': True,
+        'Data': {
+            'ResultId': 'result-1',
+            'IsFinish': True,
+            'State': 'SUCCESS',
+            'SessionData': {
+                'TotalSessionCount': sum(user_counts.values()),
+                'UserStats': [
+                    {'Key': user, 'UserList': [user], 'TotalCount': count, 'ActiveCount': 0}
+                    for user, count in user_counts.items()
+                ],
+            },
+        },
+    }))
+
+
+def test_folded_user_keeps_utilization(monkeypatch):
+    monkeypatch.setattr(settings, 'USER_TOP_K', 1)
+    monkeypatch.setattr(settings, 'SESSION_CHURN_ENABLED', False)
+    max_connections = {('rm-1', 'app'): 100, ('rm-1', 'batch'): 4}
+    handler = RDSHandler(types.SimpleNamespace(max_connections=max_connections), None)
+    instance = InstanceList(ins_id='rm-1', ins_name='rds1', ins_type='rds', aliyun_uid='uid-test')
+    target = SessionTarget(instance)
+
+    target_sessions = handler.build_session_items(target, build_response({'app': 50, 'batch': 3, 'dev': 1}))
+
+    assert [label_values[4] for label_values, _ in target_sessions.samples] == ['app', USER_OTHER]
+    utilization = dict(build_utilization({target.key: target_sessions}, max_connections)['rm-1'])
+    assert utilization == {
+        ('rm-1', 'rds1', 'rds', 'uid-test', 'app'): 0.5,
+        ('rm-1', 'rds1', 'rds', 'uid-test', 'batch'): 0.75,
+    }
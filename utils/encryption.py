@@ -1,15 +1,16 @@
 import os
 import base64
+from functools import lru_cache
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 
-def get_encryption_key():
+@lru_cache(maxsize=4)
+def _derive_key(password: str) -> bytes:
     """
-    从环境变量获取加密密钥，如果没有则生成一个
+    PBKDF2派生密钥（10万次迭代），按口令缓存，进程内只计算一次
     """
-    password = os.getenv("ENCRYPTION_PASSWORD", "default_password_for_encryption")
     salt = b'salt_32bytes_length_for_pbkdf2'  # 在生产环境中应该从环境变量获取
     
     kdf = PBKDF2HMAC(
@@ -22,11 +23,25 @@ def get_encryption_key():
     return key
 
 
+def get_encryption_key():
+    """
+    从环境变量获取加密密钥，如果没有则生成一个
+    """
+    password = os.getenv("ENCRYPTION_PASSWORD", "default_password_for_encryption")
+    return _derive_key(password)
+
+
+@lru_cache(maxsize=4)
+def _get_fernet(key: bytes) -> Fernet:
+    """按密钥缓存Fernet实例"""
+    return Fernet(key)
+
+
 def encrypt_string(plaintext: str) -> str:
     """
     加密字符串
     """
-    f = Fernet(get_encryption_key())
+    f = _get_fernet(get_encryption_key())
     encrypted_bytes = f.encrypt(plaintext.encode())
     return base64.urlsafe_b64encode(encrypted_bytes).decode()
 
@@ -35,7 +50,7 @@ def decrypt_string(encrypted_text: str) -> str:
     """
     解密字符串
     """
-    f = Fernet(get_encryption_key())
+    f = _get_fernet(get_encryption_key())
     encrypted_bytes = base64.urlsafe_b64decode(encrypted_text.encode())
     decrypted_bytes = f.decrypt(encrypted_bytes)
     return decrypted_bytes.decode()
\ No newline at end of file